@@ -0,0 +1,114 @@
+# CART 351 - PROJECT II: IMAGE BLOB STORE
+# ========================================
+# Painting images are kept out of the metadata records.
+#
+# Each image is decoded from its data URL once, on save, and written as raw
+# bytes to a content-addressed file named after its SHA-256 hash:
+#   data/blobs/3f/3fa9...c1
+# Records only keep the hash and size, so listing, stats and deletes never
+# have to push megabytes of base64 text through json.load.
+#
+# Identical images share one file. Deleting a painting leaves its blob in
+# place since another painting may point at the same hash; sweep() removes
+# blobs nothing points at any more (run by flask compact).
+
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import time
+
+from storage import write_atomic
+
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Magic bytes -> mimetype, for serving blobs without a sidecar file
+MAGIC_NUMBERS = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+]
+
+
+def decode_data_url(data_url):
+    # Split 'data:image/png;base64,....' into (mimetype, raw bytes)
+    # Raises ValueError if the string isn't a base64 image data URL
+    if not isinstance(data_url, str):
+        raise ValueError("Image data must be a string")
+
+    header, sep, payload = data_url.partition(',')
+    if not sep or not header.startswith('data:image/') or not header.endswith(';base64'):
+        raise ValueError("Image data must be a base64 data URL")
+
+    try:
+        raw = base64.b64decode(payload, validate=True)
+    except binascii.Error:
+        raise ValueError("Image data is not valid base64")
+
+    return header[len('data:'):-len(';base64')], raw
+
+
+class BlobStore:
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        # Location of a blob on disk (two-character fan-out keeps directories small)
+        if not HASH_PATTERN.match(digest):
+            raise ValueError(f"Invalid blob hash: {digest}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return HASH_PATTERN.match(digest) is not None and os.path.exists(self.path(digest))
+
+    def put(self, data):
+        # Store bytes, returning their hash. Writing the same bytes twice is a no-op.
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        try:
+            # Reused blob: refresh its mtime so sweep()'s grace period covers
+            # this save too, even if the blob had been orphaned for a while
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data)
+        return digest
+
+    def mimetype(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            head = f.read(8)
+        for magic, mimetype in MAGIC_NUMBERS:
+            if head.startswith(magic):
+                return mimetype
+        return 'application/octet-stream'
+
+    def sweep(self, live_hashes, grace_seconds=600):
+        # Delete blobs that no painting references.
+        # Recent blobs are kept: a save writes its blob before its record.
+        # Returns (blobs removed, bytes removed).
+        cutoff = time.time() - grace_seconds
+        removed, removed_bytes = 0, 0
+
+        for fanout in os.listdir(self.root):
+            directory = os.path.join(self.root, fanout)
+            if not os.path.isdir(directory):
+                continue
+            for digest in os.listdir(directory):
+                path = os.path.join(directory, digest)
+                if digest in live_hashes or not HASH_PATTERN.match(digest):
+                    continue
+                st = os.stat(path)
+                if st.st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+                    removed_bytes += st.st_size
+
+        return removed, removed_bytes
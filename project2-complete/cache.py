@@ -0,0 +1,66 @@
+# CART 351 - PROJECT II: GALLERY READ CACHE
+# ==========================================
+# Keeps the parsed gallery in memory so read endpoints don't re-open and
+# re-decode the data file on every request.
+#
+# The cache is reloaded only when:
+#  the backing file's mtime or size changes (another worker wrote to it)
+#  this process writes and calls invalidate()
+
+
+import threading
+
+
+class ReadCache:
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._signature = None   # (mtime_ns, size) of the file we loaded
+        self._paintings = []
+        self._by_id = {}
+        self._stale = True
+
+        # Counters exposed through /api/cache-stats
+        self.hits = 0
+        self.misses = 0
+
+    def paintings(self):
+        # All paintings, oldest first (callers must not modify the list)
+        return self._load()[0]
+
+    def get(self, painting_id):
+        return self._load()[1].get(painting_id)
+
+    def count(self):
+        return len(self._load()[0])
+
+    def invalidate(self):
+        # Called after every in-process write
+        with self._lock:
+            self._stale = True
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0,
+            "cached_paintings": len(self._paintings)
+        }
+
+    def _load(self):
+        with self._lock:
+            signature = self.store.signature()
+
+            if not self._stale and signature == self._signature:
+                self.hits += 1
+                return self._paintings, self._by_id
+
+            self.misses += 1
+            paintings = self.store.all()
+            self._paintings = paintings
+            self._by_id = {p['id']: p for p in paintings}
+            self._signature = signature
+            self._stale = False
+            return self._paintings, self._by_id
@@ -8,7 +8,7 @@
 #  Interactive canvas painting with multiple brush sizes
 #  Color palette selection
 #  Canvas size customization
-#  Save paintings permanently to JSON file (serverside)
+#  Save paintings permanently to an append-only log (serverside)
 #  View gallery of all user paintings
 #  Real-time collective art experience
 
@@ -19,18 +19,40 @@
 #  JSON (Data storage)
 
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context, url_for
 import json
 import os
 from datetime import datetime
 import base64
 
+from storage import open_store, sort_key
+from cache import ReadCache
+from blobs import BlobStore, decode_data_url
+from stats import open_stats
+
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_change_this'
 
 # File path for storing paintings
 PAINTINGS_FILE = 'data/paintings.json'
 
+# Content-addressed image files (see blobs.py)
+BLOBS_DIR = 'data/blobs'
+
+# Running gallery statistics (see stats.py)
+STATS_FILE = 'data/stats.json'
+
+# Storage engine: 'log' (append-only segment), 'sqlite' (indexed database
+# with full-text search) or 'json' (original single file)
+STORAGE_BACKEND = os.getenv('PAINTINGS_BACKEND', 'log')
+
+# Page size for /api/get-paintings (clients can ask for fewer, never more)
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Saves arriving this close together (milliseconds) share one fsync
+GROUP_COMMIT_WINDOW_MS = float(os.getenv('PAINTINGS_COMMIT_WINDOW_MS', '2'))
+
 
 # ============================================
 # HELPER FUNCTIONS
@@ -41,34 +63,76 @@ def ensure_data_directory():
     os.makedirs('data', exist_ok=True)
 
 
+blobs = BlobStore(BLOBS_DIR)
+
+
+def externalize_image(painting):
+    # Move inline image_data into the blob store, keeping only its hash and size
+    # Raises ValueError if image_data isn't a valid base64 data URL
+    if 'image_data' not in painting:
+        return painting
+
+    mimetype, raw = decode_data_url(painting['image_data'])
+    record = {k: v for k, v in painting.items() if k != 'image_data'}
+    record['image_hash'] = blobs.put(raw)
+    record['image_size'] = len(raw)
+    record['image_type'] = mimetype
+    return record
+
+
+def import_legacy_painting(painting):
+    # Externalize images while importing the old paintings.json
+    # (records with unreadable image data are kept as they are)
+    try:
+        return externalize_image(painting)
+    except ValueError:
+        return painting
+
+
+def public_painting(painting):
+    # Copy of a record with a URL the browser can load its image from
+    if 'image_hash' not in painting:
+        return painting
+    return dict(painting, image_url=url_for('get_image', image_hash=painting['image_hash']))
+
+
+# Open the painting store once at startup
+# (the log store imports the old paintings.json the first time it runs)
+store = open_store(STORAGE_BACKEND, os.path.dirname(PAINTINGS_FILE),
+                   prepare=import_legacy_painting,
+                   commit_window=GROUP_COMMIT_WINDOW_MS / 1000)
+
+# Parsed gallery shared by every read endpoint
+cache = ReadCache(store)
+
+# Gallery statistics, rebuilt from the store if missing or out of step with it
+aggregate = open_stats(store, STATS_FILE)
+
+
 def load_paintings():
-    # Load all paintings from JSON file
-    ensure_data_directory()
-    
-    if not os.path.exists(PAINTINGS_FILE):
-        return []
-    
+    # Load all paintings (served from the read cache)
     try:
-        with open(PAINTINGS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+        return cache.paintings()
     except Exception as e:
         print(f"Error loading paintings: {e}")
         return []
 
 
-def save_paintings(paintings):
-    # Save all paintings to JSON file
-    ensure_data_directory()
-    
+def encode_cursor(painting):
+    # Opaque cursor pointing just past a painting in gallery order
+    key = json.dumps(sort_key(painting)).encode('utf-8')
+    return base64.urlsafe_b64encode(key).decode('ascii')
+
+
+def decode_cursor(cursor):
+    # Back to the (timestamp, id) key; raises ValueError if it was tampered with
     try:
-        with open(PAINTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(paintings, f, indent=2, ensure_ascii=False)
-        return True
-    except Exception as e:
-        print(f"Error saving paintings: {e}")
-        return False
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(k, str) for k in key)):
+        raise ValueError("Invalid cursor")
+    return key
 
 
 def generate_painting_id():
@@ -138,11 +202,8 @@ def save_painting():
                     "message": f"Missing required field: {field}"
                 }), 400
         
-        # 3. Load existing paintings
-        paintings = load_paintings()
-        
-        # 4. Create new painting object
-        new_painting = {
+        # 3. Create new painting object
+        painting = {
             "id": generate_painting_id(),
             "artist_name": data['artist_name'],
             "painting_title": data['painting_title'],
@@ -154,18 +215,33 @@ def save_painting():
             "creation_time": data.get('creation_time', 0)
         }
         
-        # 5. Add to paintings list
-        paintings.append(new_painting)
+        # 4. Decode the image once and move it to the blob store
+        try:
+            new_painting = externalize_image(painting)
+        except ValueError as e:
+            return jsonify({
+                "status": "error",
+                "message": str(e)
+            }), 400
         
-        # 6. Save to JSON file
-        if save_paintings(paintings):
+        # 5. Append to the painting store
+        try:
+            store.add(new_painting)
+            cache.invalidate()
+            aggregate.record_save(new_painting)
+            saved = True
+        except OSError as e:
+            app.logger.error(f"Error saving painting: {str(e)}")
+            saved = False
+        
+        if saved:
             app.logger.info(f"Saved painting: {new_painting['id']} by {new_painting['artist_name']}")
             
             return jsonify({
                 "status": "success",
                 "message": "Painting saved successfully!",
                 "painting_id": new_painting['id'],
-                "total_paintings": len(paintings)
+                "total_paintings": store.count()
             }), 200
         else:
             return jsonify({
@@ -185,31 +261,45 @@ def save_painting():
 @app.route('/api/get-paintings', methods=['GET'])
 def get_paintings():
 
-    # API endpoint to retrieve all paintings
+    # API endpoint to retrieve paintings one page at a time, newest first
     
-    # Returns JSON array of all paintings
     # Supports optional query parameters:
-    #  limit: Maximum number of paintings to return
-    #  offset: Starting position for pagination
+    #  limit: Page size (default PAGE_SIZE, at most MAX_PAGE_SIZE)
+    #  cursor: The next_cursor from the previous page
+    #  stream: 1 to stream records one at a time instead of building the list
+    
+    # Returns next_cursor (null on the last page) for fetching the next page
 
     try:
-        # 1. Load paintings from file
-        paintings = load_paintings()
+        # 1. Get query parameters
+        limit = request.args.get('limit', default=PAGE_SIZE, type=int)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        cursor = request.args.get('cursor')
+        
+        try:
+            before = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "Invalid cursor"
+            }), 400
         
-        # 2. Get query parameters
-        limit = request.args.get('limit', type=int)
-        offset = request.args.get('offset', default=0, type=int)
+        if request.args.get('stream', type=int):
+            return stream_paintings(before, limit)
         
-        # 3. Apply pagination if requested
-        if limit:
-            paintings = paintings[offset:offset + limit]
+        # 2. Fetch one page from the store's sorted index
+        # (one extra row tells us whether another page follows)
+        page = store.page(before, limit + 1)
+        paintings = page[:limit]
+        next_cursor = encode_cursor(paintings[-1]) if len(page) > limit else None
         
-        # 4. Return paintings
+        # 3. Return paintings
         return jsonify({
             "status": "success",
-            "paintings": paintings,
-            "total": len(load_paintings()),  # Total count
-            "returned": len(paintings)        # Returned count
+            "paintings": [public_painting(p) for p in paintings],
+            "total": store.count(),  # Total count
+            "returned": len(paintings),       # Returned count
+            "next_cursor": next_cursor
         }), 200
     
     except Exception as e:
@@ -221,20 +311,40 @@ def get_paintings():
         }), 500
 
 
+def stream_paintings(before, limit):
+    # Chunked response for /api/get-paintings?stream=1
+    # Records are read from the store, encoded and sent one at a time
+    # (store.iter_page), so memory stays flat however big the page is.
+    # next_cursor comes last, in the envelope's tail, once the page is known.
+    total = store.count()
+    
+    def generate():
+        yield '{"status": "success", "paintings": ['
+        returned, last, next_cursor = 0, None, None
+        for painting in store.iter_page(before, limit + 1):
+            if returned == limit:
+                # One extra record: another page follows
+                next_cursor = encode_cursor(last)
+                break
+            yield (', ' if returned else '') + json.dumps(public_painting(painting), ensure_ascii=False)
+            returned += 1
+            last = painting
+        yield f'], "total": {total}, "returned": {returned}, "next_cursor": {json.dumps(next_cursor)}}}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
 @app.route('/api/get-painting/<painting_id>', methods=['GET'])
 def get_painting(painting_id):
     # API endpoint to retrieve a specific painting by ID
 
     try:
-        paintings = load_paintings()
-        
-        # Find painting with matching ID
-        painting = next((p for p in paintings if p['id'] == painting_id), None)
+        painting = store.get(painting_id)
         
         if painting:
             return jsonify({
                 "status": "success",
-                "painting": painting
+                "painting": public_painting(painting)
             }), 200
         else:
             return jsonify({
@@ -251,6 +361,72 @@ def get_painting(painting_id):
         }), 500
 
 
+@app.route('/api/search-paintings', methods=['GET'])
+def search_paintings():
+    # API endpoint to search paintings by title or artist
+    
+    # Query parameters:
+    #  q: Words to look for (each word matches as a prefix)
+    #  limit: Maximum number of results (default 50)
+    
+    # The SQLite backend uses its FTS5 index; the file backends scan the
+    # cached gallery, so the browser never needs the whole archive to filter
+
+    try:
+        query = request.args.get('q', default='').strip()
+        limit = request.args.get('limit', default=50, type=int)
+        
+        if not query:
+            return jsonify({
+                "status": "error",
+                "message": "Missing search query: q"
+            }), 400
+        
+        if STORAGE_BACKEND == 'sqlite':
+            results = store.search(query, limit)
+        else:
+            needle = query.lower()
+            results = [
+                p for p in load_paintings()
+                if needle in p['painting_title'].lower() or needle in p['artist_name'].lower()
+            ][:limit]
+        
+        return jsonify({
+            "status": "success",
+            "paintings": [public_painting(p) for p in results],
+            "returned": len(results)
+        }), 200
+    
+    except Exception as e:
+        app.logger.error(f"Error searching paintings: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Failed to search paintings",
+            "error": str(e)
+        }), 500
+
+
+@app.route('/api/images/<image_hash>', methods=['GET'])
+def get_image(image_hash):
+    # Serve a painting image as raw bytes
+    # The hash is the content, so the ETag is strong and the file never changes
+    if not blobs.exists(image_hash):
+        return jsonify({
+            "status": "error",
+            "message": "Image not found"
+        }), 404
+
+    response = send_file(
+        blobs.path(image_hash),
+        mimetype=blobs.mimetype(image_hash),
+        etag=image_hash,
+        conditional=True,
+        max_age=31536000
+    )
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/api/gallery-stats', methods=['GET'])
 def gallery_stats():
  
@@ -263,42 +439,10 @@ def gallery_stats():
     #  Average painting time
   
     try:
-        paintings = load_paintings()
-        
-        # Calculate statistics
-        total_paintings = len(paintings)
-        artists = list(set(p['artist_name'] for p in paintings))
-        
-        # Collect all colors used
-        all_colors = []
-        for p in paintings:
-            all_colors.extend(p.get('colors_used', []))
-        
-        # Count color frequency
-        color_counts = {}
-        for color in all_colors:
-            color_counts[color] = color_counts.get(color, 0) + 1
-        
-        # Sort by frequency
-        popular_colors = sorted(
-            color_counts.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:10]  # Top 10 colors
-        
-        # Calculate average creation time
-        creation_times = [p.get('creation_time', 0) for p in paintings]
-        avg_time = sum(creation_times) / len(creation_times) if creation_times else 0
-        
+        # Maintained incrementally by save/delete, so this is a constant-time read
         return jsonify({
             "status": "success",
-            "stats": {
-                "total_paintings": total_paintings,
-                "total_artists": len(artists),
-                "artists": artists,
-                "popular_colors": [{"color": c, "count": count} for c, count in popular_colors],
-                "average_creation_time": round(avg_time, 2)
-            }
+            "stats": aggregate.snapshot()
         }), 200
     
     except Exception as e:
@@ -317,14 +461,12 @@ def delete_painting(painting_id):
     # (Optional - for admin purposes)
    
     try:
-        paintings = load_paintings()
-        
-        # Filter out the painting to delete
-        original_count = len(paintings)
-        paintings = [p for p in paintings if p['id'] != painting_id]
+        # Append a tombstone (the store returns None if the ID is unknown)
+        removed = store.delete(painting_id)
+        cache.invalidate()
         
-        if len(paintings) < original_count:
-            save_paintings(paintings)
+        if removed is not None:
+            aggregate.record_delete(removed)
             return jsonify({
                 "status": "success",
                 "message": "Painting deleted successfully"
@@ -344,6 +486,83 @@ def delete_painting(painting_id):
         }), 500
 
 
+def compact_storage():
+    # Compact the painting store, then sweep image blobs no painting uses.
+    # Reads keep being served while this runs.
+    report = store.compact()
+    cache.invalidate()
+    
+    live_hashes = {p['image_hash'] for p in store.iter_paintings() if 'image_hash' in p}
+    blobs_removed, blob_bytes = blobs.sweep(live_hashes)
+    report['blobs_removed'] = blobs_removed
+    report['blob_bytes_reclaimed'] = blob_bytes
+    
+    app.logger.info(f"Compacted storage: {report}")
+    return report
+
+
+@app.route('/api/admin/compact', methods=['POST'])
+def compact():
+    # API endpoint to reclaim space left behind by deleted paintings
+    # (Optional - for admin purposes)
+    
+    # Returns bytes reclaimed and elapsed time
+    
+    try:
+        return jsonify({
+            "status": "success",
+            "report": compact_storage()
+        }), 200
+    
+    except Exception as e:
+        app.logger.error(f"Error compacting storage: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "Failed to compact storage",
+            "error": str(e)
+        }), 500
+
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    # API endpoint to inspect the gallery read cache (hit/miss counters)
+    return jsonify({
+        "status": "success",
+        "cache": cache.stats()
+    }), 200
+
+
+# ============================================
+# COMMANDS
+# ============================================
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    # flask --app server rebuild-stats
+    # Recompute gallery statistics from the raw store and report any drift
+    before = aggregate.snapshot()
+    aggregate.rebuild(store.all())
+    after = aggregate.snapshot()
+
+    if before == after:
+        print(f"Stats verified: {after['total_paintings']} paintings, incremental aggregate matches")
+    else:
+        print("Stats rebuilt: incremental aggregate had drifted")
+        print(f"  before: {json.dumps(before)}")
+        print(f"  after:  {json.dumps(after)}")
+
+
+@app.cli.command('compact')
+def compact_command():
+    # flask --app server compact
+    # Rewrite live paintings into a fresh segment and report space reclaimed
+    report = compact_storage()
+    print(f"Compacted {report['live_paintings']} paintings in {report['elapsed_ms']} ms")
+    print(f"  storage: {report['bytes_before']} -> {report['bytes_after']} bytes "
+          f"({report['bytes_reclaimed']} reclaimed)")
+    print(f"  blobs:   {report['blobs_removed']} removed ({report['blob_bytes_reclaimed']} bytes)")
+
+
 # ============================================
 # RUN APPLICATION
 # ============================================
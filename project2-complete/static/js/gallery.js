@@ -5,6 +5,9 @@
 // Global Variables
 let allPaintings = [];
 let currentModal = null;
+let nextCursor = null;      // Cursor for the next page (null when there are no more)
+let isLoadingPage = false;
+let scrollObserver = null;
 
 // ==========================================
 // INITIALIZATION
@@ -22,6 +25,20 @@ window.addEventListener('DOMContentLoaded', async () => {
 // FETCH AND LOAD GALLERY
 // ==========================================
 
+async function fetchPaintingsPage(cursor) {
+  // One page of paintings, newest first
+  const url = cursor
+    ? `/api/get-paintings?cursor=${encodeURIComponent(cursor)}`
+    : '/api/get-paintings';
+  const response = await fetch(url);
+  const data = await response.json();
+
+  if (!response.ok) {
+    throw new Error(data.message || `HTTP ${response.status}`);
+  }
+  return data;
+}
+
 async function loadGallery() {
   const loadingIndicator = document.getElementById('loadingIndicator');
   const paintingsGrid = document.getElementById('paintingsGrid');
@@ -33,17 +50,18 @@ async function loadGallery() {
     paintingsGrid.style.display = 'none';
     noPaintings.style.display = 'none';
 
-    // Fetch paintings from server
-    const response = await fetch('/api/get-paintings');
-    const data = await response.json();
+    // Fetch the first page from the server
+    const data = await fetchPaintingsPage(null);
 
     // Hide loading
     loadingIndicator.style.display = 'none';
 
-    if (response.ok && data.paintings && data.paintings.length > 0) {
+    if (data.paintings && data.paintings.length > 0) {
       allPaintings = data.paintings;
+      nextCursor = data.next_cursor;
       renderPaintings(allPaintings);
       paintingsGrid.style.display = 'grid';
+      initializeInfiniteScroll();
     } else {
       noPaintings.style.display = 'block';
     }
@@ -62,6 +80,44 @@ async function loadGallery() {
   }
 }
 
+// ==========================================
+// INFINITE SCROLL
+// ==========================================
+
+function initializeInfiniteScroll() {
+  // Fetch the next page whenever the sentinel below the grid scrolls into view
+  const sentinel = document.getElementById('scrollSentinel');
+  if (!sentinel || scrollObserver) {
+    return;
+  }
+
+  scrollObserver = new IntersectionObserver((entries) => {
+    if (entries.some(entry => entry.isIntersecting)) {
+      loadNextPage();
+    }
+  }, { rootMargin: '400px' });
+
+  scrollObserver.observe(sentinel);
+}
+
+async function loadNextPage() {
+  if (!nextCursor || isLoadingPage) {
+    return;
+  }
+
+  isLoadingPage = true;
+  try {
+    const data = await fetchPaintingsPage(nextCursor);
+    nextCursor = data.next_cursor;
+    allPaintings = allPaintings.concat(data.paintings);
+    appendPaintings(data.paintings);
+  } catch (error) {
+    console.error('Error loading more paintings:', error);
+  } finally {
+    isLoadingPage = false;
+  }
+}
+
 // ==========================================
 // RENDER PAINTINGS GRID
 // ==========================================
@@ -87,6 +143,18 @@ function renderPaintings(paintings) {
   animateCards();
 }
 
+function appendPaintings(paintings) {
+  // Add another page below the cards already shown (pages arrive newest first)
+  const paintingsGrid = document.getElementById('paintingsGrid');
+  const firstNew = paintingsGrid.children.length;
+
+  paintings.forEach((painting, index) => {
+    paintingsGrid.appendChild(createPaintingCard(painting, firstNew + index));
+  });
+
+  animateCards(firstNew);
+}
+
 // ==========================================
 // CREATE PAINTING CARD
 // ==========================================
@@ -150,8 +218,8 @@ function createPaintingCard(painting, index) {
 // ANIMATE CARDS ON LOAD
 // ==========================================
 
-function animateCards() {
-  const cards = document.querySelectorAll('.painting-card');
+function animateCards(fromIndex = 0) {
+  const cards = Array.from(document.querySelectorAll('.painting-card')).slice(fromIndex);
   
   cards.forEach((card, index) => {
     setTimeout(() => {
@@ -391,11 +459,23 @@ setInterval(async () => {
 // OPTIONAL: FILTERING & SORTING
 // ==========================================
 
-function filterPaintingsByArtist(artistName) {
-  const filtered = allPaintings.filter(p => 
-    p.metadata.artist_name.toLowerCase().includes(artistName.toLowerCase())
-  );
-  renderPaintings(filtered);
+async function filterPaintingsByArtist(artistName) {
+  // Search runs on the server, so the full archive never has to be in the browser
+  if (!artistName.trim()) {
+    renderPaintings(allPaintings);
+    return;
+  }
+
+  try {
+    const response = await fetch(`/api/search-paintings?q=${encodeURIComponent(artistName)}`);
+    const data = await response.json();
+
+    if (response.ok && data.paintings) {
+      renderPaintings(data.paintings);
+    }
+  } catch (error) {
+    console.error('Error searching paintings:', error);
+  }
 }
 
 function sortPaintings(criteria) {
@@ -434,6 +514,7 @@ window.galleryFunctions = {
   filterPaintingsByArtist,
   sortPaintings,
   loadGallery,
+  loadNextPage,
   loadStats
 };
 
@@ -445,4 +526,5 @@ console.log('%cGallery Functions Available:', 'color: #50fa7b; font-weight: bold
 console.log('  window.galleryFunctions.filterPaintingsByArtist(name)');
 console.log('  window.galleryFunctions.sortPaintings(criteria)');
 console.log('  window.galleryFunctions.loadGallery()');
+console.log('  window.galleryFunctions.loadNextPage()');
 console.log('  window.galleryFunctions.loadStats()');
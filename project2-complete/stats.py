@@ -0,0 +1,259 @@
+# CART 351 - PROJECT II: GALLERY STATISTICS
+# ==========================================
+# Running totals for /api/gallery-stats, persisted as a snapshot plus a
+# journal of changes since it:
+#   data/stats.json     - full totals (artist and colour counts included)
+#   data/stats.journal  - one JSON line per saved or deleted painting
+#
+# save_painting and delete_painting append one small line, so a save costs
+# the same however many artists and colours the gallery has. Loading
+# folds the journal into the snapshot; once COMPACT_EVERY lines have built
+# up, the next update writes a fresh snapshot and empties the journal.
+# rebuild() recomputes everything from scratch (flask rebuild-stats).
+#
+# Both files are derived data and written without an fsync: a save
+# doesn't wait on a second disk flush after the store's group commit.
+# If a crash leaves them stale or torn, open_stats() finds the totals out
+# of step with the store at the next start and rebuilds them.
+#
+# The SQLite backend doesn't need a separate aggregate: SqliteStats asks
+# the database, which answers from its indexes.
+
+
+import heapq
+import json
+import os
+
+from storage import FileLock, SqliteStore, file_signature, write_atomic
+
+
+class TopK:
+    # Exact counts plus a leaderboard of the K most frequent keys.
+    # The leaderboard is patched on each change; it is only recomputed
+    # from all counts when one of its members goes down.
+
+    def __init__(self, k, counts=None):
+        self.k = k
+        self.counts = dict(counts or {})
+        self._refill()
+
+    def add(self, key, delta=1):
+        count = self.counts.get(key, 0) + delta
+        if count > 0:
+            self.counts[key] = count
+        else:
+            self.counts.pop(key, None)
+
+        if key in self._top:
+            if delta < 0:
+                self._refill()
+            else:
+                self._sort()
+        elif count > 0 and (len(self._top) < self.k or count > self.counts[self._top[-1]]):
+            self._top.append(key)
+            self._sort()
+            del self._top[self.k:]
+
+    def top(self):
+        return [(key, self.counts[key]) for key in self._top]
+
+    def _sort(self):
+        self._top.sort(key=lambda key: self.counts[key], reverse=True)
+
+    def _refill(self):
+        self._top = heapq.nlargest(self.k, self.counts, key=lambda key: self.counts[key])
+
+
+class GalleryStats:
+
+    TOP_COLORS = 10
+
+    # Journal lines folded into a new snapshot
+    COMPACT_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.journal'
+        self._lock = FileLock(path + '.lock')
+        self._signature = None      # snapshot the in-memory totals start from
+        self._journal_offset = 0    # how far into the journal they include
+        self._journal_lines = 0
+        self._reset()
+        with self._lock:
+            self._reload()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    # ---------- updates ----------
+
+    # Each update catches up with the journal and appends to it under the
+    # lock, so concurrent workers never lose each other's counts
+
+    def record_save(self, painting):
+        with self._lock:
+            self._reload()
+            self._record(painting, 1)
+
+    def record_delete(self, painting):
+        with self._lock:
+            self._reload()
+            self._record(painting, -1)
+
+    def rebuild(self, paintings):
+        # Recompute from the raw store, replacing whatever was persisted
+        with self._lock:
+            self._reset()
+            for painting in paintings:
+                self._apply(painting, 1)
+            self._write()
+
+    # ---------- reads ----------
+
+    def snapshot(self):
+        # Same shape /api/gallery-stats has always returned
+        with self._lock:
+            self._reload()
+            artists = list(self.artist_counts)
+            avg_time = self.creation_time_sum / self.total_paintings if self.total_paintings else 0
+
+            return {
+                "total_paintings": self.total_paintings,
+                "total_artists": len(artists),
+                "artists": artists,
+                "popular_colors": [{"color": c, "count": count} for c, count in self.colors.top()],
+                "average_creation_time": round(avg_time, 2)
+            }
+
+    # ---------- internals ----------
+
+    def _reset(self):
+        self.total_paintings = 0
+        self.artist_counts = {}
+        self.colors = TopK(self.TOP_COLORS)
+        self.creation_time_sum = 0
+
+    def _apply(self, painting, sign):
+        self.total_paintings += sign
+        self.creation_time_sum += sign * (painting.get('creation_time') or 0)
+
+        artist = painting['artist_name']
+        count = self.artist_counts.get(artist, 0) + sign
+        if count > 0:
+            self.artist_counts[artist] = count
+        else:
+            self.artist_counts.pop(artist, None)
+
+        for color in painting.get('colors_used', []):
+            self.colors.add(color, sign)
+
+    def _record(self, painting, sign):
+        # Apply one painting's change and append it to the journal
+        self._apply(painting, sign)
+        entry = {
+            "sign": sign,
+            "artist_name": painting['artist_name'],
+            "colors_used": painting.get('colors_used') or [],
+            "creation_time": painting.get('creation_time') or 0
+        }
+        with open(self.journal_path, 'ab') as f:
+            f.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+            self._journal_offset = f.tell()
+        self._journal_lines += 1
+
+        if self._journal_lines >= self.COMPACT_EVERY:
+            self._write()
+
+    def _reload(self):
+        # Pick up changes written by another worker
+        signature = file_signature(self.path)
+        if signature != self._signature:
+            # New snapshot (first load, or another worker compacted):
+            # start over from it and the whole journal
+            self._reset()
+            self._journal_offset, self._journal_lines = 0, 0
+            self._signature = signature
+            if signature is not None:
+                self._load_snapshot()
+        self._fold_journal()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError:
+            # Torn by a crash (it isn't fsynced): count from zero so
+            # open_stats sees the mismatch, until the next write replaces it
+            return
+
+        self.total_paintings = data['total_paintings']
+        self.artist_counts = data['artist_counts']
+        self.colors = TopK(self.TOP_COLORS, data['color_counts'])
+        self.creation_time_sum = data['creation_time_sum']
+
+    def _fold_journal(self):
+        # Apply journal lines appended since we last looked
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue    # torn by a crash
+            self._apply(entry, entry['sign'])
+            self._journal_lines += 1
+        self._journal_offset += end
+
+    def _write(self):
+        # Write a full snapshot and empty the journal it now includes
+        data = {
+            "total_paintings": self.total_paintings,
+            "artist_counts": self.artist_counts,
+            "color_counts": self.colors.counts,
+            "creation_time_sum": self.creation_time_sum
+        }
+
+        write_atomic(self.path, json.dumps(data, ensure_ascii=False).encode('utf-8'), durable=False)
+        open(self.journal_path, 'wb').close()
+        self._signature = file_signature(self.path)
+        self._journal_offset, self._journal_lines = 0, 0
+
+
+class SqliteStats:
+    # Same interface as GalleryStats, answered by SqliteStore.stats()
+
+    def __init__(self, store):
+        self.store = store
+
+    def exists(self):
+        return True
+
+    def record_save(self, painting):
+        pass
+
+    def record_delete(self, painting):
+        pass
+
+    def rebuild(self, paintings):
+        pass
+
+    def snapshot(self):
+        return self.store.stats(GalleryStats.TOP_COLORS)
+
+
+def open_stats(store, path):
+    # Statistics for the active backend.
+    # The file aggregate is rebuilt if missing or out of step with the store.
+    if isinstance(store, SqliteStore):
+        return SqliteStats(store)
+
+    stats = GalleryStats(path)
+    if not stats.exists() or stats.total_paintings != store.count():
+        stats.rebuild(store.all())
+    return stats
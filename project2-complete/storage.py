@@ -0,0 +1,847 @@
+# CART 351 - PROJECT II: PAINTING STORAGE ENGINES
+# ================================================
+# Pluggable storage for the collective gallery.
+#
+# Engines:
+#  JsonFileStore - the original format, one JSON list rewritten on every save
+#  LogStore      - append-only JSON-lines segment (default)
+#  SqliteStore   - SQLite database with indexes and full-text search
+#
+# Every engine exposes the same small interface, so server.py never needs
+# to know which one is active:
+#  all()            -> list of paintings, oldest first
+#  iter_paintings(start, stop) -> the same order, one record at a time
+#  get(id)          -> one painting or None
+#  page(before, limit) -> newest first, older than the (timestamp, id) key
+#  iter_page(before, limit) -> the same page, one record at a time
+#  count()          -> number of live paintings
+#  add(painting)    -> store a new painting
+#  delete(id)       -> remove a painting, returns the removed record or None
+#  signature()      -> (mtime_ns, size) of the backing file, for cache checks
+#  compact()        -> reclaim space left by deletes, returns a report dict
+
+
+import bisect
+import itertools
+import json
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: threads in one process are still serialised
+    fcntl = None
+
+
+def file_signature(path):
+    # (mtime_ns, size) of a file, or None if it doesn't exist yet
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def sort_key(painting):
+    # Gallery order key; pages run from the largest key down
+    return (painting.get('timestamp', ''), painting['id'])
+
+
+def write_atomic(path, data, durable=True):
+    # Write bytes to a temp file, fsync, then rename over `path`.
+    # Readers see either the old file or the new one, never half of each.
+    # durable=False skips the fsync, for derived files that can be rebuilt
+    # if a power loss leaves them stale or empty.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FileLock:
+    # Exclusive lock shared by the threads of this process (threading.Lock)
+    # and by other worker processes (flock on a sidecar .lock file)
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._file = open(self.path, 'ab')
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if fcntl:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+        finally:
+            self._file = None
+            self._thread_lock.release()
+
+
+# ============================================
+# JSON FILE STORE (original format)
+# ============================================
+
+class JsonFileStore:
+    # One JSON array holding every painting.
+    # Each save parses and rewrites the whole file, so cost grows with the gallery.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = FileLock(path + '.lock')
+
+    def all(self):
+        if not os.path.exists(self.path):
+            return []
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return []
+
+    def iter_paintings(self, start=0, stop=None):
+        return iter(self.all()[start:stop])
+
+    def get(self, painting_id):
+        return next((p for p in self.all() if p['id'] == painting_id), None)
+
+    def page(self, before=None, limit=24):
+        newest = sorted(self.all(), key=sort_key, reverse=True)
+        if before:
+            newest = [p for p in newest if sort_key(p) < tuple(before)]
+        return newest[:limit]
+
+    def iter_page(self, before=None, limit=24):
+        # The whole file is parsed either way
+        return iter(self.page(before, limit))
+
+    def count(self):
+        return len(self.all())
+
+    def signature(self):
+        return file_signature(self.path)
+
+    def add(self, painting):
+        # Read-modify-write under the lock so overlapping saves can't drop each other
+        with self._lock:
+            paintings = self.all()
+            paintings.append(painting)
+            self._write(paintings)
+
+    def delete(self, painting_id):
+        with self._lock:
+            paintings = self.all()
+            removed = next((p for p in paintings if p['id'] == painting_id), None)
+
+            if removed is not None:
+                self._write([p for p in paintings if p['id'] != painting_id])
+            return removed
+
+    def compact(self):
+        # Every save already rewrites the whole file, so there are no dead bytes
+        started = time.monotonic()
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {
+            "live_paintings": self.count(),
+            "bytes_before": size,
+            "bytes_after": size,
+            "bytes_reclaimed": 0,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+    def _write(self, paintings):
+        data = json.dumps(paintings, indent=2, ensure_ascii=False)
+        write_atomic(self.path, data.encode('utf-8'))
+
+
+# ============================================
+# APPEND-ONLY LOG STORE
+# ============================================
+
+class LogStore:
+    # Append-only JSON-lines segment.
+    #
+    # Every line is one operation:
+    #   {"op": "put", "painting": {...}}
+    #   {"op": "del", "id": "painting_..."}
+    #
+    # Saves append a single line and deletes append a tombstone, so a write
+    # costs the size of one record no matter how big the gallery is.
+    #
+    # An offset index (painting ID -> byte offset and length of its "put"
+    # line) is kept in memory and persisted next to the segment:
+    #   data/paintings.idx
+    # The segment is memory-mapped, so fetching one painting decodes just
+    # its own byte slice instead of replaying the whole file.
+
+    INDEX_HEADER = b'LOGIDX 2\n'
+
+    def __init__(self, path, legacy_path=None, prepare=None, commit_window=0.002):
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + '.idx'
+        self.prepare = prepare   # Optional hook applied to each imported record
+        self._index = {}     # ID -> (offset, length, timestamp) of each live painting
+        self._sorted = []    # (timestamp, ID) of each live painting, ascending
+        self._offset = 0     # How far into the segment the index covers
+        self._mm = None      # Read-only memory map of the segment
+        self._inode = None   # Identity of the segment file the index describes
+
+        # Writers take the file lock; readers only need the index lock
+        self._lock = FileLock(path + '.lock')
+        self._index_lock = threading.Lock()
+
+        # Group commit: saves arriving within `commit_window` seconds of each
+        # other are written together and share a single fsync
+        self.commit_window = commit_window
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._has_leader = False
+
+        with self._lock:
+            # Import the old list-of-dicts file exactly once
+            if not os.path.exists(path):
+                if legacy_path and os.path.exists(legacy_path):
+                    self._import_legacy(legacy_path)
+                else:
+                    open(path, 'ab').close()
+
+            self._repair_tail()
+
+            # Use the persisted index if it still matches the segment,
+            # otherwise rebuild it with one full scan
+            if not self._load_index():
+                self._rebuild_index()
+            self._inode = os.stat(path).st_ino
+            self._catch_up(persist=True)
+
+    # ---------- reads ----------
+
+    # Index entries and the memory map are always taken together under the
+    # index lock, so a compaction swapping the segment can't mix them up
+
+    def all(self):
+        self._catch_up()
+        with self._index_lock:
+            entries, mm = list(self._index.values()), self._map()
+        return [self._decode(mm, entry[0], entry[1]) for entry in entries]
+
+    def iter_paintings(self, start=0, stop=None):
+        # Decode one record at a time from the memory map
+        self._catch_up()
+        with self._index_lock:
+            entries, mm = list(self._index.values()), self._map()
+        for entry in itertools.islice(entries, start, stop):
+            yield self._decode(mm, entry[0], entry[1])
+
+    def get(self, painting_id):
+        self._catch_up()
+        with self._index_lock:
+            entry, mm = self._index.get(painting_id), self._map()
+        if entry is None:
+            return None
+        return self._decode(mm, entry[0], entry[1])
+
+    def page(self, before=None, limit=24):
+        return list(self.iter_page(before, limit))
+
+    def iter_page(self, before=None, limit=24):
+        # Newest paintings first, strictly older than the `before` key
+        # (timestamp, id). A binary search over the sorted keys finds where
+        # the page starts, so every page costs the same as the first.
+        # The page's entries are picked up front; records are decoded from
+        # the memory map one at a time as the caller iterates.
+        self._catch_up()
+        with self._index_lock:
+            end = bisect.bisect_left(self._sorted, tuple(before)) if before else len(self._sorted)
+            keys = self._sorted[max(end - limit, 0):end]
+            entries = [self._index[painting_id] for _, painting_id in reversed(keys)]
+            mm = self._map()
+
+        for entry in entries:
+            yield self._decode(mm, entry[0], entry[1])
+
+    def count(self):
+        self._catch_up()
+        return len(self._index)
+
+    def signature(self):
+        return file_signature(self.path)
+
+    # ---------- writes ----------
+
+    def add(self, painting):
+        # Queue the record for the next group commit and wait until it is durable.
+        # The first waiting thread becomes the leader: it sleeps for the commit
+        # window, then writes everything queued so far with one fsync.
+        write = PendingWrite({"op": "put", "painting": painting})
+
+        with self._pending_lock:
+            self._pending.append(write)
+            leader = not self._has_leader
+            self._has_leader = True
+
+        if leader:
+            time.sleep(self.commit_window)
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+                self._has_leader = False
+            self._commit(batch)
+
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+
+    def delete(self, painting_id):
+        # Checked and written under the lock so two deletes can't both succeed
+        with self._lock:
+            removed = self.get(painting_id)
+            if removed is None:
+                return None
+
+            self._write_ops([{"op": "del", "id": painting_id}])
+            self._catch_up()
+            return removed
+
+    def _commit(self, batch):
+        try:
+            with self._lock:
+                self._write_ops([write.op for write in batch])
+            self._catch_up()
+        except Exception as e:
+            for write in batch:
+                write.error = e
+        finally:
+            for write in batch:
+                write.done.set()
+
+    # ---------- compaction ----------
+
+    def compact(self):
+        # Rewrite the live records into a fresh segment, dropping deleted
+        # paintings and tombstones, then swap it in with os.replace.
+        #
+        # Phase 1 copies a snapshot of the live records without any lock,
+        # so reads and saves carry on. Phase 2 takes the writer lock, copies
+        # whatever was appended meanwhile, and swaps the segment and index.
+        started = time.monotonic()
+        bytes_before = os.path.getsize(self.path) + os.path.getsize(self.index_path)
+        segment_tmp = self.path + '.compact'
+        index_tmp = self.index_path + '.compact'
+
+        self._catch_up()
+        with self._index_lock:
+            snapshot, covered, mm = list(self._index.items()), self._offset, self._map()
+            inode = self._inode
+
+        entries = []
+        with open(segment_tmp, 'wb') as out:
+            position = 0
+            for painting_id, (offset, length, timestamp) in snapshot:
+                out.write(mm[offset:offset + length])
+                entries.append(('P', painting_id, position, length, timestamp))
+                position += length
+
+            with self._lock:
+                if os.stat(self.path).st_ino != inode:
+                    raise RuntimeError("The log was compacted by another worker")
+
+                for offset, length, op in self._scan(covered):
+                    line = (json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8')
+                    out.write(line)
+                    entries.append(self._entry_for(op, position, len(line)))
+                    position += len(line)
+                out.flush()
+                os.fsync(out.fileno())
+
+                with open(index_tmp, 'wb') as f:
+                    f.write(self.INDEX_HEADER)
+                    f.write(b''.join(self._index_line(*entry) for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # A crash between these leaves an index that fails validation
+                # on startup and gets rebuilt, never a wrong one
+                os.replace(segment_tmp, self.path)
+                os.replace(index_tmp, self.index_path)
+
+                with self._index_lock:
+                    self._reset_index()
+                    self._mm = None
+                    for entry in entries:
+                        self._apply(*entry)
+                    self._inode = os.stat(self.path).st_ino
+
+        bytes_after = os.path.getsize(self.path) + os.path.getsize(self.index_path)
+        return {
+            "live_paintings": len(self._index),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": bytes_before - bytes_after,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+    # ---------- segment ----------
+
+    def _write_ops(self, ops):
+        # Append operations and their index lines with one write and one fsync each.
+        # Caller must hold the file lock.
+        lines = [(json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8') for op in ops]
+        index_lines = []
+
+        with open(self.path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            for op, line in zip(ops, lines):
+                index_lines.append(self._index_line(*self._entry_for(op, offset, len(line))))
+                offset += len(line)
+
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+        # The index is derived data (rebuilt on startup if stale), so no fsync
+        with open(self.index_path, 'ab') as f:
+            f.write(b''.join(index_lines))
+
+    def _scan(self, start):
+        # Yield (offset, length, operation) for every complete line from `start`
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    yield offset, len(line), json.loads(line)
+                offset += len(line)
+
+    def _map(self):
+        # Memory map covering everything the index points at.
+        # Remapped when the segment grows; old maps close once no reader holds them.
+        if self._mm is None or len(self._mm) < self._offset:
+            if self._offset == 0:
+                return b''
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def _decode(self, mm, offset, length):
+        return json.loads(mm[offset:offset + length])['painting']
+
+    def _repair_tail(self):
+        # A crash in the middle of an append leaves a line without its newline.
+        # Cut it off so the next append starts on a clean line.
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+
+    def _import_legacy(self, legacy_path):
+        # Convert the original paintings.json list into a fresh segment.
+        # Written to a temp file and renamed so a crash can't leave half an import.
+        legacy = JsonFileStore(legacy_path).all()
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            for painting in legacy:
+                if self.prepare:
+                    painting = self.prepare(painting)
+                op = {"op": "put", "painting": painting}
+                f.write((json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
+        print(f"Imported {len(legacy)} paintings from {legacy_path} into {self.path}")
+
+    # ---------- offset index ----------
+    #
+    # The index file is a header line followed by one tab-separated line per
+    # segment operation, appended by whoever wrote that operation:
+    #   P  <id>  <offset>  <length>  <timestamp>    painting stored at this slice
+    #   D  <id>  <offset>  <length>                 tombstone at this slice
+    # The timestamp lets the sorted page index be rebuilt without the segment.
+
+    def _reset_index(self):
+        self._index, self._sorted, self._offset = {}, [], 0
+
+    def _entry_for(self, op, offset, length):
+        if op['op'] == 'put':
+            painting = op['painting']
+            return ('P', painting['id'], offset, length, painting.get('timestamp', ''))
+        return ('D', op['id'], offset, length, '')
+
+    def _apply(self, kind, painting_id, offset, length, timestamp=''):
+        old = self._index.pop(painting_id, None)
+        if old is not None:
+            position = bisect.bisect_left(self._sorted, (old[2], painting_id))
+            del self._sorted[position]
+
+        if kind == 'P':
+            self._index[painting_id] = (offset, length, timestamp)
+            bisect.insort(self._sorted, (timestamp, painting_id))
+        self._offset = max(self._offset, offset + length)
+
+    def _catch_up(self, persist=False):
+        # Index operations appended since we last looked
+        # (by this process or by another worker sharing the file).
+        # At startup (persist=True) they are also written to the index file,
+        # covering records whose index line was lost in a crash.
+        entries = []
+        with self._index_lock:
+            self._reload_if_replaced()
+            for offset, length, op in self._scan(self._offset):
+                entry = self._entry_for(op, offset, length)
+                self._apply(*entry)
+                entries.append(entry)
+
+        if persist and entries:
+            with open(self.index_path, 'ab') as f:
+                f.write(b''.join(self._index_line(*entry) for entry in entries))
+
+    def _reload_if_replaced(self):
+        # Another worker compacted the log: the old offsets mean nothing in the
+        # new file, so start over from its index (or a scan if that is stale).
+        # Caller must hold the index lock.
+        inode = os.stat(self.path).st_ino
+        if inode == self._inode:
+            return
+
+        self._mm = None
+        self._load_index()
+        self._inode = inode
+
+    def _index_line(self, kind, painting_id, offset, length, timestamp=''):
+        if kind == 'P':
+            return f"{kind}\t{painting_id}\t{offset}\t{length}\t{timestamp}\n".encode('utf-8')
+        return f"{kind}\t{painting_id}\t{offset}\t{length}\n".encode('utf-8')
+
+    def _load_index(self):
+        # Load the persisted index. Returns False if it is missing or stale.
+        # Starts from nothing: after a compaction the old offsets (and the
+        # old segment size in _offset) must not survive into the new file.
+        self._reset_index()
+        try:
+            with open(self.index_path, 'rb') as f:
+                if f.readline() != self.INDEX_HEADER:
+                    return False
+                last = None
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    kind, painting_id, offset, length, *timestamp = line.decode('utf-8').rstrip('\n').split('\t')
+                    last = (kind, painting_id, int(offset), int(length))
+                    self._apply(*last, *timestamp)
+        except (FileNotFoundError, ValueError):
+            self._reset_index()
+            return False
+
+        # The last entry must still point at the matching line in the segment
+        if last is not None and not self._entry_matches(*last):
+            self._reset_index()
+            return False
+        return True
+
+    def _entry_matches(self, kind, painting_id, offset, length):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            line = f.read(length)
+        try:
+            op = json.loads(line)
+        except ValueError:
+            return False
+
+        if kind == 'P':
+            return op.get('op') == 'put' and op['painting'].get('id') == painting_id
+        return op.get('op') == 'del' and op.get('id') == painting_id
+
+    def _rebuild_index(self):
+        # Scan the whole segment once and write a fresh index file
+        self._reset_index()
+        tmp_path = self.index_path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            f.write(self.INDEX_HEADER)
+            for offset, length, op in self._scan(0):
+                entry = self._entry_for(op, offset, length)
+                self._apply(*entry)
+                f.write(self._index_line(*entry))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.index_path)
+        print(f"Rebuilt index for {self.path} ({len(self._index)} paintings)")
+
+
+class PendingWrite:
+    # One save waiting for the next group commit
+
+    def __init__(self, op):
+        self.op = op
+        self.done = threading.Event()
+        self.error = None
+
+
+# ============================================
+# SQLITE STORE
+# ============================================
+
+class SqliteStore:
+    # Paintings in an SQLite database (data/paintings.db).
+    #
+    # Searchable columns are real columns with indexes; the full record is
+    # kept as JSON alongside them. Images stay out of row in the blob store,
+    # so rows only carry the image hash.
+    #
+    # Each thread gets its own connection. WAL mode lets reads continue
+    # while a save is being committed.
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS paintings (
+            id TEXT PRIMARY KEY,
+            artist_name TEXT NOT NULL,
+            painting_title TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            creation_time REAL NOT NULL DEFAULT 0,
+            record TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS paintings_timestamp ON paintings (timestamp, id);
+        CREATE INDEX IF NOT EXISTS paintings_artist ON paintings (artist_name);
+
+        CREATE TABLE IF NOT EXISTS painting_colors (
+            painting_id TEXT NOT NULL REFERENCES paintings (id) ON DELETE CASCADE,
+            color TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS painting_colors_painting ON painting_colors (painting_id);
+        CREATE INDEX IF NOT EXISTS painting_colors_color ON painting_colors (color);
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS paintings_fts USING fts5 (
+            painting_title, artist_name, content='paintings', content_rowid='rowid'
+        );
+        CREATE TRIGGER IF NOT EXISTS paintings_fts_insert AFTER INSERT ON paintings BEGIN
+            INSERT INTO paintings_fts (rowid, painting_title, artist_name)
+            VALUES (new.rowid, new.painting_title, new.artist_name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS paintings_fts_delete AFTER DELETE ON paintings BEGIN
+            INSERT INTO paintings_fts (paintings_fts, rowid, painting_title, artist_name)
+            VALUES ('delete', old.rowid, old.painting_title, old.artist_name);
+        END;
+    """
+
+    def __init__(self, path, legacy=None):
+        self.path = path
+        self._local = threading.local()
+
+        with FileLock(path + '.lock'):
+            conn = self._conn()
+            conn.executescript(self.SCHEMA)
+
+            # Import the existing gallery the first time the database is created
+            # (user_version marks the database as initialised)
+            if conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                paintings = legacy() if legacy is not None else []
+                with conn:
+                    for painting in paintings:
+                        self._insert(conn, painting)
+                    conn.execute("PRAGMA user_version = 1")
+                print(f"Imported {len(paintings)} paintings into {self.path}")
+
+    # ---------- reads ----------
+
+    def all(self):
+        return list(self.iter_paintings())
+
+    def iter_paintings(self, start=0, stop=None):
+        limit = -1 if stop is None else max(stop - start, 0)
+        rows = self._conn().execute(
+            "SELECT record FROM paintings ORDER BY rowid LIMIT ? OFFSET ?", (limit, start))
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def get(self, painting_id):
+        row = self._conn().execute(
+            "SELECT record FROM paintings WHERE id = ?", (painting_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def page(self, before=None, limit=24):
+        return list(self.iter_page(before, limit))
+
+    def iter_page(self, before=None, limit=24):
+        # Walks the (timestamp, id) index backwards from the cursor,
+        # fetching rows as the caller iterates
+        if before:
+            rows = self._conn().execute(
+                """SELECT record FROM paintings WHERE (timestamp, id) < (?, ?)
+                   ORDER BY timestamp DESC, id DESC LIMIT ?""", (before[0], before[1], limit))
+        else:
+            rows = self._conn().execute(
+                "SELECT record FROM paintings ORDER BY timestamp DESC, id DESC LIMIT ?", (limit,))
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM paintings").fetchone()[0]
+
+    def signature(self):
+        # Commits land in the -wal file first, so watch both files
+        return (file_signature(self.path), file_signature(self.path + '-wal'))
+
+    def search(self, query, limit=50):
+        # Full-text search over titles and artist names.
+        # Every word is matched as a prefix, best matches first.
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+
+        match = ' '.join(f'"{word}"*' for word in words)
+        rows = self._conn().execute(
+            """SELECT p.record FROM paintings_fts
+               JOIN paintings p ON p.rowid = paintings_fts.rowid
+               WHERE paintings_fts MATCH ?
+               ORDER BY rank LIMIT ?""", (match, limit))
+        return [json.loads(record) for (record,) in rows]
+
+    def stats(self, top_colors=10):
+        # Gallery statistics straight from the indexes
+        conn = self._conn()
+        total, avg_time = conn.execute(
+            "SELECT COUNT(*), COALESCE(AVG(creation_time), 0) FROM paintings").fetchone()
+        artists = [name for (name,) in conn.execute(
+            "SELECT DISTINCT artist_name FROM paintings")]
+        colors = conn.execute(
+            """SELECT color, COUNT(*) AS uses FROM painting_colors
+               GROUP BY color ORDER BY uses DESC LIMIT ?""", (top_colors,)).fetchall()
+
+        return {
+            "total_paintings": total,
+            "total_artists": len(artists),
+            "artists": artists,
+            "popular_colors": [{"color": c, "count": count} for c, count in colors],
+            "average_creation_time": round(avg_time, 2)
+        }
+
+    # ---------- writes ----------
+
+    def add(self, painting):
+        conn = self._conn()
+        with conn:
+            self._insert(conn, painting)
+
+    def delete(self, painting_id):
+        conn = self._conn()
+        with conn:
+            row = conn.execute(
+                "SELECT record FROM paintings WHERE id = ?", (painting_id,)).fetchone()
+            # rowcount tells us whether this delete won against a concurrent one
+            if row is None or conn.execute(
+                    "DELETE FROM paintings WHERE id = ?", (painting_id,)).rowcount == 0:
+                return None
+        return json.loads(row[0])
+
+    # ---------- compaction ----------
+
+    def compact(self):
+        # Checkpoint the WAL, merge the FTS segments, rebuild the indexes and
+        # VACUUM the free pages away. VACUUM works on a copy, so readers
+        # on other connections keep going until it commits.
+        started = time.monotonic()
+        bytes_before = self._size()
+        conn = self._conn()
+
+        conn.execute("INSERT INTO paintings_fts (paintings_fts) VALUES ('optimize')")
+        conn.commit()
+        conn.execute("REINDEX")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        bytes_after = self._size()
+        return {
+            "live_paintings": self.count(),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_reclaimed": bytes_before - bytes_after,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+
+    def _size(self):
+        return sum(os.path.getsize(p) for p in (self.path, self.path + '-wal') if os.path.exists(p))
+
+    # ---------- internals ----------
+
+    def _insert(self, conn, painting):
+        conn.execute(
+            """INSERT INTO paintings (id, artist_name, painting_title, timestamp, creation_time, record)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (painting['id'], painting['artist_name'], painting['painting_title'],
+             painting['timestamp'], painting.get('creation_time') or 0,
+             json.dumps(painting, ensure_ascii=False)))
+        conn.executemany(
+            "INSERT INTO painting_colors (painting_id, color) VALUES (?, ?)",
+            [(painting['id'], color) for color in painting.get('colors_used', [])])
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = conn
+        return conn
+
+
+# ============================================
+# FACTORY
+# ============================================
+
+def open_store(backend, data_dir='data', prepare=None, commit_window=0.002):
+    # Open the storage engine named in config
+    # `prepare` rewrites records imported from the old paintings.json
+    # `commit_window` is how long (seconds) the log store gathers saves per fsync
+    os.makedirs(data_dir, exist_ok=True)
+    legacy_path = os.path.join(data_dir, 'paintings.json')
+
+    if backend == 'json':
+        return JsonFileStore(legacy_path)
+    if backend == 'log':
+        return LogStore(os.path.join(data_dir, 'paintings.log'),
+                        legacy_path=legacy_path, prepare=prepare, commit_window=commit_window)
+    if backend == 'sqlite':
+        # A new database is seeded from the log if there is one, else paintings.json
+        log_path = os.path.join(data_dir, 'paintings.log')
+
+        def legacy():
+            if os.path.exists(log_path):
+                return LogStore(log_path).all()
+            if os.path.exists(legacy_path):
+                return [prepare(p) if prepare else p for p in JsonFileStore(legacy_path).all()]
+            return []
+
+        return SqliteStore(os.path.join(data_dir, 'paintings.db'), legacy=legacy)
+
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,22 @@
+# PROJECT III: BACKGROUND JOBS
+# =============================
+# Periodic work that shouldn't run inside a request (stats reconciliation,
+# trending ranking) runs on daemon threads started here.
+
+
+import threading
+
+
+def run_periodically(job, interval, name, logger):
+    # Call job() every `interval` seconds until the returned event is set.
+    # A failing run is logged and retried on the next tick.
+    def run():
+        while not stopped.wait(interval):
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Error in background job {name}: {str(e)}")
+
+    stopped = threading.Event()
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return stopped
@@ -0,0 +1,75 @@
+# PROJECT III: USER CACHE
+# ========================
+# Logged-in users are looked up on every rendered page (the inject_user
+# context processor) and again by routes that call get_current_user().
+#
+# UserCache keeps recently loaded user documents in memory across requests:
+#  at most max_size users, least recently used evicted first
+#  entries older than ttl seconds are reloaded
+#  invalidate() drops a user after their document changes
+#
+# server.load_user() adds a per-request layer on flask.g on top of this.
+
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+
+    def __init__(self, loader, max_size=256, ttl=60):
+        self.loader = loader      # user_id -> user document (or None)
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # user_id -> (loaded at, document)
+        self._generation = 0            # bumped by invalidate()
+
+        # Counters exposed through /api/cache-stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        # The user's document (callers must not modify it)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        # Load outside the lock so one slow query doesn't stall other requests
+        user = self.loader(user_id)
+        if user is None:
+            return None
+
+        with self._lock:
+            # Don't cache a document an invalidate() may have overtaken
+            if generation != self._generation:
+                return user
+            self._entries[user_id] = (time.monotonic(), user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return user
+
+    def invalidate(self, user_id):
+        # Called after every write to a user document
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generation += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0,
+            "cached_users": len(self._entries)
+        }
@@ -8,8 +8,45 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
     MONGO_URI = os.getenv('MONGO_URI')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '100'))  # creations per /api/creations/batch
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
+    # Create missing MongoDB indexes when the server starts
+    ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', '1') == '1'
+    # Seconds between background recounts of the community stats (0 = never)
+    STATS_RECONCILE_INTERVAL = int(os.getenv('STATS_RECONCILE_INTERVAL', '3600'))
+    # Users kept in memory across requests, and how long (seconds) before reloading
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '256'))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))
+    # Trending ranking: seconds between re-ranks, creations kept, and the
+    # decay (score = (likes + view_weight * views) / (age_hours + 2) ^ gravity)
+    TRENDING_INTERVAL = int(os.getenv('TRENDING_INTERVAL', '300'))
+    TRENDING_SIZE = int(os.getenv('TRENDING_SIZE', '100'))
+    TRENDING_GRAVITY = float(os.getenv('TRENDING_GRAVITY', '1.5'))
+    TRENDING_VIEW_WEIGHT = float(os.getenv('TRENDING_VIEW_WEIGHT', '0.1'))
+    # Buffered like counters are written every N milliseconds, or sooner
+    # once M increments are waiting
+    COUNTER_FLUSH_INTERVAL_MS = int(os.getenv('COUNTER_FLUSH_INTERVAL_MS', '200'))
+    COUNTER_FLUSH_MAX_OPS = int(os.getenv('COUNTER_FLUSH_MAX_OPS', '500'))
+    # Painting views: 'exact' counts every view, 'sampled' counts one in
+    # VIEW_SAMPLE_EVERY (weighted to match) for less write load
+    VIEW_COUNTING = os.getenv('VIEW_COUNTING', 'exact')
+    VIEW_SAMPLE_EVERY = int(os.getenv('VIEW_SAMPLE_EVERY', '10'))
+    # Worker processes compressing uploads, and how many uploads may be
+    # queued or in progress before new ones are turned away (503)
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+    IMAGE_QUEUE_SIZE = int(os.getenv('IMAGE_QUEUE_SIZE', '32'))
+    # Seconds after which an upload still 'processing' at startup is
+    # considered abandoned by an earlier run and marked failed
+    UPLOAD_STALE_AFTER = int(os.getenv('UPLOAD_STALE_AFTER', '600'))
+    # Saved canvas images: 'lossless' re-encodes them without loss (WebP
+    # lossless, or optimized PNG), 'webp' stores lossy WebP at SNAPSHOT_QUALITY
+    SNAPSHOT_FORMAT = os.getenv('SNAPSHOT_FORMAT', 'lossless').lower()
+    SNAPSHOT_QUALITY = int(os.getenv('SNAPSHOT_QUALITY', '85'))
+    # Largest canvas image (width * height) stored as is; bigger ones are
+    # scaled down to fit, or refused with SNAPSHOT_OVERSIZE=reject
+    SNAPSHOT_MAX_PIXELS = int(os.getenv('SNAPSHOT_MAX_PIXELS', str(2048 * 2048)))
+    SNAPSHOT_OVERSIZE = os.getenv('SNAPSHOT_OVERSIZE', 'downscale').lower()
 
 class DevelopmentConfig(Config):
     DEBUG = True
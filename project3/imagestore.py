@@ -0,0 +1,123 @@
+# PROJECT III: IMAGE STORE
+# =========================
+# Image bytes live in GridFS (bucket 'images'), not in the documents.
+#
+# A document only keeps references to its files:
+#   images: {'full': ObjectId, '64': ObjectId, '256': ObjectId, '800': ObjectId}
+# (flowers and charms migrated from base64 may also have 'thumbnail').
+#
+# Files are written once and never changed, so a file id doubles as the
+# ETag when serving it. /api/images streams files chunk by chunk rather
+# than loading them whole.
+#
+# Uploaded flowers and charms are stored once per distinct image. Their
+# files are registered under the image's content hash in db.image_blobs:
+#   {_id: sha256, images: {key: file id}, refs: N}
+# Every upload of the same picture takes a reference on the blob and points
+# at its files; release() drops a reference and deletes the files with the
+# last one.
+
+
+import gridfs
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class ImageStore:
+
+    def __init__(self, db, bucket_name='images'):
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name)
+        self.blobs = db.image_blobs
+
+    def put(self, raw, mimetype, filename='image'):
+        # Store bytes, returning the new file's id
+        return self.bucket.upload_from_stream(filename, raw, metadata={'contentType': mimetype})
+
+    def put_files(self, files, prefix):
+        # {key: (bytes, mimetype)} -> {key: file id}
+        # Keys sharing the same bytes (small images) share one file.
+        images, stored = {}, {}
+        for key, (raw, mimetype) in files.items():
+            if raw not in stored:
+                stored[raw] = self.put(raw, mimetype, f'{prefix}/{key}')
+            images[key] = stored[raw]
+        return images
+
+    def delete(self, file_id):
+        try:
+            self.bucket.delete(file_id)
+        except gridfs.errors.NoFile:
+            pass
+
+    def delete_all(self, images):
+        # Delete every file in {key: file id}
+        for file_id in set(images.values()):
+            self.delete(file_id)
+
+    # ---------- shared (content-addressed) files ----------
+
+    def put_shared(self, content_hash, files, prefix):
+        # Reference the stored copy of content_hash, writing files only if
+        # this content hasn't been stored before. Returns {key: file id}.
+        images = self._acquire(content_hash)
+        if images is None:
+            images = self.share(content_hash, self.put_files(files, prefix))
+        return images
+
+    def share(self, content_hash, images):
+        # Register already-stored files as the copy of content_hash and take
+        # a reference. If a copy exists, these files are deleted in favour of
+        # it. Returns the copy's {key: file id}.
+        try:
+            self.blobs.insert_one({'_id': content_hash, 'images': images, 'refs': 1})
+            return images
+        except DuplicateKeyError:
+            existing = self._acquire(content_hash)
+            self.delete_all(images)
+            return existing
+
+    def release(self, content_hash):
+        # Drop one reference; the last one deletes the files
+        blob = self.blobs.find_one_and_update(
+            {'_id': content_hash},
+            {'$inc': {'refs': -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob and blob['refs'] <= 0:
+            if self.blobs.delete_one({'_id': content_hash, 'refs': {'$lte': 0}}).deleted_count:
+                self.delete_all(blob['images'])
+
+    def _acquire(self, content_hash):
+        blob = self.blobs.find_one_and_update(
+            {'_id': content_hash},
+            {'$inc': {'refs': 1}},
+            projection={'images': 1}
+        )
+        return blob['images'] if blob else None
+
+    # ---------- reads ----------
+
+    def open(self, file_id):
+        # GridOut for a stored file;
+        # raises gridfs.errors.NoFile if it doesn't exist
+        return self.bucket.open_download_stream(file_id)
+
+    def stream(self, file_id):
+        # (chunk iterator, length, mimetype) for serving a stored file
+        grid_out = self.open(file_id)
+        mimetype = (grid_out.metadata or {}).get('contentType', 'application/octet-stream')
+        return self._chunks(grid_out), grid_out.length, mimetype
+
+    def _chunks(self, grid_out):
+        # GridOut iterates by line, so read it one GridFS chunk at a time instead
+        try:
+            chunk = grid_out.readchunk()
+            while chunk:
+                yield chunk
+                chunk = grid_out.readchunk()
+        finally:
+            grid_out.close()
+
+    def read(self, file_id):
+        with self.open(file_id) as grid_out:
+            return grid_out.read()
@@ -0,0 +1,444 @@
+# PROJECT III: IMAGE PROCESSING PIPELINE
+# =======================================
+# Images are resized and re-encoded off the request.
+#
+# Jobs run in worker processes (CPU-bound PIL work stays outside the
+# server's GIL) and return image files to store plus fields to $set:
+#   process_upload   - flower/charm upload: compress the file, build
+#                      derivatives, mark the document 'ready'
+#   process_snapshot - saved creation: build derivatives of its canvas image
+# A single server-side thread then writes each result (the store stage):
+# files go to the ImageStore (GridFS) and the document gets their ids
+# under images.<key>.
+#
+# Uploads are deduplicated: the worker hashes the normalised image
+# (content_hash) and the store stage references the shared copy of that
+# content instead of writing it again (ImageStore.put_shared). Repeat
+# uploads of a picture are marked duplicate_of the first one.
+#
+# Saved canvas images are recompressed in the request, before anything is
+# stored (recompress_snapshot): the browser's toDataURL PNGs are barely
+# compressed, and an image over the pixel budget has to be refused (or
+# scaled down) there and then.
+#
+# Derivatives are smaller copies at fixed sizes (DERIVATIVE_SIZES, longest
+# side in px), stored once as images.64 / images.256 / images.800 and
+# picked by /api/images/<kind>/<id>?size=.
+#
+# A worker that dies (killed for memory, or crashing inside PIL) breaks the
+# whole process pool: the jobs it held fail, and the next submit() starts a
+# fresh pool.
+#
+# The pipeline holds at most max_queue jobs; beyond that submit() refuses
+# (uploads answer 503) so a burst can't pile up unbounded work.
+# Queue depth and per-stage timings are exposed through /api/queue-stats.
+
+
+import base64
+import hashlib
+import io
+import os
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, features
+
+
+# Extensions PIL re-encodes (SVGs are stored as uploaded)
+RASTER_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# Derivative sizes (longest side, px): palette icons, grid tiles, detail view
+DERIVATIVE_SIZES = [64, 256, 800]
+DERIVATIVE_QUALITY = 80
+
+# Saved canvas image encodings (SNAPSHOT_FORMAT) and what happens to
+# images over the pixel budget (SNAPSHOT_OVERSIZE)
+SNAPSHOT_FORMATS = {'lossless', 'webp'}
+SNAPSHOT_OVERSIZE_MODES = {'downscale', 'reject'}
+
+# Downscaling shrinks an image's area by at most this factor; anything larger
+# is refused outright, so a request never decodes more than this many times
+# the pixel budget
+SNAPSHOT_DOWNSCALE_LIMIT = 4
+
+
+def sniff_mimetype(raw):
+    # Mimetype from an image's leading bytes
+    if raw.startswith(b'\x89PNG'):
+        return 'image/png'
+    if raw.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if raw.startswith(b'GIF8'):
+        return 'image/gif'
+    if raw.startswith(b'RIFF') and raw[8:12] == b'WEBP':
+        return 'image/webp'
+    if raw.lstrip().startswith((b'<svg', b'<?xml')):
+        return 'image/svg+xml'
+    return 'application/octet-stream'
+
+
+def decode_image(value):
+    # Base64 image (data URL or bare base64) -> (raw bytes, mimetype)
+    if value.startswith('data:'):
+        header, _, payload = value.partition(',')
+        return base64.b64decode(payload), header[len('data:'):].split(';')[0]
+
+    raw = base64.b64decode(value)
+    return raw, sniff_mimetype(raw)
+
+
+def content_hash(raw):
+    # sha256 of an image's pixels rather than its encoding, so re-saved
+    # copies of one picture hash alike. Raw bytes for SVG (or anything PIL
+    # can't decode).
+    digest = hashlib.sha256()
+    try:
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+        digest.update(f'{img.mode} {img.size}'.encode('ascii'))
+        digest.update(img.tobytes())
+    except OSError:
+        digest.update(raw)
+    return digest.hexdigest()
+
+
+def make_derivatives(raw):
+    # Raster image bytes -> {'64': (bytes, mimetype), '256': ..., '800': ...}
+    # WebP where Pillow supports it; otherwise JPEG, or PNG to keep transparency.
+    # Sizes the image is already smaller than reuse the largest copy that fits.
+    img = Image.open(io.BytesIO(raw))
+    img.load()
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+
+    if features.check('webp'):
+        save_format, mimetype = 'WEBP', 'image/webp'
+    elif has_alpha:
+        save_format, mimetype = 'PNG', 'image/png'
+    else:
+        save_format, mimetype = 'JPEG', 'image/jpeg'
+
+    derivatives = {}
+    previous = None
+    for size in DERIVATIVE_SIZES:
+        if previous and max(img.size) <= previous:
+            derivatives[str(size)] = derivatives[str(previous)]
+            continue
+        copy = img.copy()
+        copy.thumbnail((size, size), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        copy.save(out, save_format, quality=DERIVATIVE_QUALITY, optimize=True)
+        derivatives[str(size)] = (out.getvalue(), mimetype)
+        previous = size
+    return derivatives
+
+
+def recompress_snapshot(raw, snapshot_format='lossless', quality=85, max_pixels=None, downscale=True):
+    # Re-encode a saved canvas image for storage -> (bytes, mimetype, info)
+    #   snapshot_format - 'lossless': WebP lossless (optimized PNG without
+    #                     WebP support); 'webp': lossy WebP at quality
+    #   max_pixels      - pixel budget (width * height); larger images are
+    #                     scaled down to fit (up to SNAPSHOT_DOWNSCALE_LIMIT
+    #                     times the budget), or refused if not downscale
+    # info records original_bytes, stored_bytes, width, height, downscaled.
+    # The original bytes are kept if re-encoding doesn't make them smaller.
+    # Raises ValueError for anything that isn't a decodable image within budget.
+    if sniff_mimetype(raw) == 'image/svg+xml':
+        return raw, 'image/svg+xml', {'original_bytes': len(raw), 'stored_bytes': len(raw)}
+
+    try:
+        img = Image.open(io.BytesIO(raw))
+        width, height = img.size
+        # Checked before decoding, so a refused image is never expanded
+        # (max_pixels=None means no budget)
+        over_budget = bool(max_pixels) and width * height > max_pixels
+        if over_budget:
+            limit = max_pixels * SNAPSHOT_DOWNSCALE_LIMIT if downscale else max_pixels
+            if width * height > limit:
+                raise ValueError(f'Image is {width}x{height}, over the {limit} pixel limit')
+            scale = (max_pixels / (width * height)) ** 0.5
+            target = (max(int(width * scale), 1), max(int(height * scale), 1))
+            # JPEGs can decode straight at a reduced size
+            img.draft('RGB', target)
+        img.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f'Invalid image: {e}')
+
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    if over_budget:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    if features.check('webp'):
+        mimetype = 'image/webp'
+        if snapshot_format == 'webp':
+            img.save(out, 'WEBP', quality=quality, method=4)
+        else:
+            img.save(out, 'WEBP', lossless=True, quality=100, method=4)
+    elif snapshot_format == 'webp' and not has_alpha:
+        mimetype = 'image/jpeg'
+        img.save(out, 'JPEG', quality=quality, optimize=True)
+    else:
+        mimetype = 'image/png'
+        img.save(out, 'PNG', optimize=True)
+    stored = out.getvalue()
+
+    if not over_budget and len(stored) >= len(raw):
+        stored, mimetype = raw, sniff_mimetype(raw)
+
+    return stored, mimetype, {
+        'original_bytes': len(raw),
+        'stored_bytes': len(stored),
+        'width': img.width,
+        'height': img.height,
+        'downscaled': over_budget
+    }
+
+
+def compress_image(filepath, max_width=800):
+    # Compress image for storage
+    img = Image.open(filepath)
+    img.thumbnail((max_width, max_width), Image.Resampling.LANCZOS)
+    img.save(filepath, quality=85, optimize=True)
+
+
+def process_upload(filepath, max_width=800):
+    # Runs in a worker process: compress the uploaded file, hash it and
+    # build its derivatives. The file is only a hand-off from the request
+    # and is removed once read.
+    timings = {}
+    error = None
+    is_raster = filepath.rsplit('.', 1)[-1].lower() in RASTER_EXTENSIONS
+
+    try:
+        started = time.perf_counter()
+        if is_raster:
+            try:
+                compress_image(filepath, max_width)
+            except Exception as e:
+                # Keep the original bytes, as uploads always have
+                error = f"Error compressing image: {e}"
+        timings['compress'] = time.perf_counter() - started
+
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+    finally:
+        os.remove(filepath)
+
+    started = time.perf_counter()
+    digest = content_hash(raw)
+    timings['hash'] = time.perf_counter() - started
+
+    files = {'full': (raw, sniff_mimetype(raw))}
+    if is_raster:
+        started = time.perf_counter()
+        files.update(make_derivatives(raw))
+        timings['derivatives'] = time.perf_counter() - started
+
+    return {
+        'files': files,
+        'content_hash': digest,
+        'set': {'status': 'ready'},
+        'timings': timings,
+        'warning': error
+    }
+
+
+def process_snapshot(raw):
+    # Runs in a worker process: build derivatives of a saved creation's image
+    if sniff_mimetype(raw) == 'image/svg+xml':
+        return {'files': {}, 'set': {}, 'timings': {}, 'warning': None}
+
+    started = time.perf_counter()
+    files = make_derivatives(raw)
+    return {
+        'files': files,
+        'set': {},
+        'timings': {'derivatives': time.perf_counter() - started},
+        'warning': None
+    }
+
+
+def store_files(image_store, collection, doc_id, files):
+    # Write a job's files to the image store -> {'images.<key>': file id}
+    images = image_store.put_files(files, f'{collection}/{doc_id}')
+    return {f'images.{key}': file_id for key, file_id in images.items()}
+
+
+def shared_upload_fields(db, collection, doc_id, digest, images):
+    # $set fields pointing an upload at the shared copy of its image.
+    # If the collection already has this picture, the upload is marked
+    # duplicate_of the earliest one, which stays the entry pickers list.
+    fields = {'images': images, 'content_hash': digest}
+    original = db[collection].find_one(
+        {'content_hash': digest, 'duplicate_of': {'$exists': False}, '_id': {'$ne': doc_id}},
+        {'_id': 1},
+        sort=[('_id', 1)]
+    )
+    if original:
+        fields['duplicate_of'] = original['_id']
+    return fields
+
+
+class StageTimer:
+    # Count / total / max duration of one pipeline stage
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else 0,
+            "max_ms": round(self.max * 1000, 2)
+        }
+
+
+class ImagePipeline:
+
+    def __init__(self, db, image_store, max_workers=2, max_queue=32, logger=None):
+        self.db = db
+        self.image_store = image_store
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._processes = None      # created on first upload
+        self._store = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-store')
+        self._in_flight = 0
+
+        # Counters exposed through /api/queue-stats
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.timers = defaultdict(StageTimer)
+
+    def submit(self, collection, doc_id, job, *args, failed_status=True):
+        # Queue job(*args) for one document. Returns False if the pipeline is full.
+        # failed_status marks the document status 'failed' if the job raises.
+        with self._lock:
+            if self._in_flight >= self.max_queue:
+                self.rejected += 1
+                return False
+            self._in_flight += 1
+
+        queued_at = time.perf_counter()
+        try:
+            future = self._submit_job(job, args)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        future.add_done_callback(
+            lambda f: self._store_result(collection, doc_id, f, queued_at, failed_status)
+        )
+        return True
+
+    def _submit_job(self, job, args):
+        processes = self._pool()
+        try:
+            return processes.submit(job, *args)
+        except BrokenProcessPool:
+            # A worker died; the jobs it took down fail on their own, this
+            # one goes to a new pool
+            return self._pool(replace=processes).submit(job, *args)
+
+    def _pool(self, replace=None):
+        # The process pool, created on first use (or when `replace` is broken)
+        with self._lock:
+            if self._processes is None or self._processes is replace:
+                if replace is not None:
+                    replace.shutdown(wait=False)
+                    self.restarts += 1
+                # spawn, not fork: the server process has MongoDB and
+                # background threads that mustn't be copied into workers.
+                # Spawned workers may re-import server.py as __mp_main__,
+                # which skips its connections and threads (IMAGE_WORKER).
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._processes
+
+    def close(self):
+        # Let queued uploads finish before the process exits.
+        # Register with threading._register_atexit, not atexit: concurrent.futures
+        # stops accepting work in its own threading-exit hook, which runs
+        # before atexit handlers (and after hooks registered later than it).
+        if self._processes is not None:
+            self._processes.shutdown(wait=True)
+        self._store.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_queue": self.max_queue,
+                "workers": self.max_workers,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+                "stages": {stage: timer.stats() for stage, timer in sorted(self.timers.items())}
+            }
+
+    def _store_result(self, collection, doc_id, future, queued_at, failed_status):
+        try:
+            self._store.submit(self._finish, collection, doc_id, future, queued_at, failed_status)
+        except RuntimeError:
+            # Interpreter shutting down: the store thread takes no new work,
+            # so store the result from this thread rather than lose it
+            self._finish(collection, doc_id, future, queued_at, failed_status)
+
+    def _finish(self, collection, doc_id, future, queued_at, failed_status):
+        # Store stage: record the worker's result on the document
+        started = time.perf_counter()
+        try:
+            result = future.result()
+            fields = dict(result['set'], processing_ms=round((started - queued_at) * 1000, 2))
+            if result.get('content_hash'):
+                images = self.image_store.put_shared(result['content_hash'], result['files'],
+                                                     f'{collection}/{doc_id}')
+                fields.update(shared_upload_fields(self.db, collection, doc_id, result['content_hash'], images))
+            else:
+                fields.update(store_files(self.image_store, collection, doc_id, result['files']))
+            self.db[collection].update_one({'_id': doc_id}, {'$set': fields})
+            if result['warning'] and self.logger:
+                self.logger.error(result['warning'])
+
+            with self._lock:
+                self.completed += 1
+                timings = result['timings']
+                for stage, seconds in timings.items():
+                    self.timers[stage].record(seconds)
+                self.timers['queue_wait'].record(max(started - queued_at - sum(timings.values()), 0))
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error processing image for {collection} {doc_id}: {str(e)}")
+            if failed_status:
+                try:
+                    self.db[collection].update_one({'_id': doc_id}, {'$set': {'status': 'failed', 'error': str(e)}})
+                except Exception as store_error:
+                    if self.logger:
+                        self.logger.error(f"Error marking upload {doc_id} failed: {str(store_error)}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._in_flight -= 1
+                self.timers['store'].record(finished - started)
+                self.timers['total'].record(finished - queued_at)
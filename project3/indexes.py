@@ -0,0 +1,123 @@
+# PROJECT III: MONGODB INDEXES
+# =============================
+# Every index the server's queries rely on, declared in one place.
+#
+# ensure_indexes() creates anything missing. create_index is a no-op for an
+# index that already exists with the same spec, so it's safe to run on every
+# start (and with flask --app server ensure-indexes).
+#
+# check_query_plans() runs explain() on each route's canonical query and
+# reports any that MongoDB would answer with a collection scan
+# (flask --app server check-indexes).
+
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+
+# collection -> [(index name, keys)]
+# List endpoints page by (sort field, _id), so their indexes end in _id
+INDEXES = {
+    'users': [
+        ('username', [('username', ASCENDING)]),
+        ('email', [('email', ASCENDING)]),
+    ],
+    'paintings': [
+        ('created_at_id', [('created_at', DESCENDING), ('_id', DESCENDING)]),
+        ('likes_id', [('likes', DESCENDING), ('_id', DESCENDING)]),
+        ('creator_created_at', [('creator_id', ASCENDING), ('created_at', DESCENDING)]),
+        ('workshop_created_at_id',
+         [('workshop_type', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        ('workshop_product_created_at_id',
+         [('workshop_type', ASCENDING), ('product_type', ASCENDING), ('created_at', DESCENDING),
+          ('_id', DESCENDING)]),
+    ],
+    'arrangements': [
+        ('created_at_id', [('created_at', DESCENDING), ('_id', DESCENDING)]),
+        ('creator_created_at', [('creator_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    'bracelets': [
+        ('created_at_id', [('created_at', DESCENDING), ('_id', DESCENDING)]),
+        ('creator_created_at', [('creator_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    'flowers': [
+        ('usage_count_id', [('usage_count', DESCENDING), ('_id', DESCENDING)]),
+        ('content_hash_id', [('content_hash', ASCENDING), ('_id', ASCENDING)]),
+    ],
+    'charms': [
+        ('usage_count_id', [('usage_count', DESCENDING), ('_id', DESCENDING)]),
+        ('content_hash_id', [('content_hash', ASCENDING), ('_id', ASCENDING)]),
+    ],
+}
+
+# The query behind each indexed route: (label, collection, filter, sort)
+# Placeholder values stand in for request data; the plan doesn't depend on them
+CANONICAL_QUERIES = [
+    ('login', 'users', {'username': ''}, None),
+    ('register', 'users', {'email': ''}, None),
+    ('creations feed: paintings', 'paintings', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('creations feed: arrangements', 'arrangements', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('creations feed: bracelets', 'bracelets', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/paintings', 'paintings',
+     {'workshop_type': 'product_painting'}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/paintings?product_type', 'paintings',
+     {'workshop_type': 'product_painting', 'product_type': ''},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/paintings?sort_by=-likes', 'paintings',
+     {'workshop_type': 'product_painting'}, [('likes', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/flowers', 'flowers',
+     {'status': {'$nin': ['processing', 'failed']}, 'duplicate_of': {'$exists': False}},
+     [('usage_count', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/charms', 'charms',
+     {'status': {'$nin': ['processing', 'failed']}, 'duplicate_of': {'$exists': False}},
+     [('usage_count', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/arrangements', 'arrangements', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('GET /api/bracelets', 'bracelets', {}, [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('profile: paintings', 'paintings', {'creator_id': None}, None),
+    ('profile: arrangements', 'arrangements', {'creator_id': None}, None),
+    ('profile: bracelets', 'bracelets', {'creator_id': None}, None),
+    ('upload dedup: flowers', 'flowers', {'content_hash': ''}, [('_id', ASCENDING)]),
+    ('upload dedup: charms', 'charms', {'content_hash': ''}, [('_id', ASCENDING)]),
+]
+
+
+def ensure_indexes(db):
+    # Create every registered index that doesn't exist yet.
+    # Returns [(collection, index name, error or None)]
+    results = []
+    for collection, indexes in INDEXES.items():
+        for name, keys in indexes:
+            try:
+                db[collection].create_index(keys, name=name)
+                results.append((collection, name, None))
+            except OperationFailure as e:
+                # e.g. an index on the same keys already exists under another name
+                results.append((collection, name, str(e)))
+    return results
+
+
+def plan_stages(plan):
+    # Every stage name in an explain() plan tree
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def check_query_plans(db):
+    # Explain each canonical query.
+    # Returns [(label, stages of the winning plan, uses a collection scan)]
+    results = []
+    for label, collection, filter_query, sort in CANONICAL_QUERIES:
+        cursor = db[collection].find(filter_query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = list(plan_stages(winning_plan))
+        results.append((label, stages, 'COLLSCAN' in stages))
+    return results
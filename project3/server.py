@@ -5,20 +5,43 @@
 # flower arrangements, and charm bracelets in a shared community space.
 
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory, Response, g
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from werkzeug.utils import secure_filename
-from PIL import Image
 from datetime import datetime
 from datetime import timedelta
 from functools import wraps
 from config import Config
 import os
+import sys
+import atexit
+import threading
+import random
 import base64
+import hashlib
 import json
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from bson import json_util
+from gridfs.errors import NoFile
 from config import config
+from indexes import ensure_indexes, check_query_plans
+from stats import CommunityStats
+from trending import TrendingRanker
+from background import run_periodically
+from writebehind import CounterBuffer
+from imaging import (ImagePipeline, process_upload, process_snapshot, decode_image, store_files,
+                     content_hash, shared_upload_fields, recompress_snapshot, DERIVATIVE_SIZES,
+                     SNAPSHOT_FORMATS, SNAPSHOT_OVERSIZE_MODES)
+from imagestore import ImageStore
+from cache import UserCache
+
+# Image pipeline workers are spawned processes. When the server runs as
+# `python server.py`, each one re-imports this file as __mp_main__; they only
+# run imaging.py jobs, so nothing below that talks to MongoDB or starts a
+# thread runs there.
+IMAGE_WORKER = __name__ == '__mp_main__'
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -26,22 +49,109 @@ app.config.from_object(config[os.getenv('FLASK_ENV', 'development')])
 
 # Load configuration
 app.config.from_object(Config)
+# A misspelled snapshot setting would otherwise fall back silently
+if app.config['SNAPSHOT_FORMAT'] not in SNAPSHOT_FORMATS:
+    raise ValueError(f"SNAPSHOT_FORMAT must be one of {sorted(SNAPSHOT_FORMATS)}, "
+                     f"not {app.config['SNAPSHOT_FORMAT']!r}")
+if app.config['SNAPSHOT_OVERSIZE'] not in SNAPSHOT_OVERSIZE_MODES:
+    raise ValueError(f"SNAPSHOT_OVERSIZE must be one of {sorted(SNAPSHOT_OVERSIZE_MODES)}, "
+                     f"not {app.config['SNAPSHOT_OVERSIZE']!r}")
+
 # DEBUG: Print to see if MONGO_URI is loaded
 print(f"DEBUG: MONGO_URI = {app.config.get('MONGO_URI')}")
-# Initialize MongoDB
-mongo = PyMongo(app)
+# Initialize MongoDB (connecting on first use, so image workers never do)
+mongo = PyMongo(app, connect=False)
 
 # Test connection
-try:
-    mongo.db.command('ping')
-    print("✅ MongoDB connected successfully!")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
+if not IMAGE_WORKER:
+    try:
+        mongo.db.command('ping')
+        print("✅ MongoDB connected successfully!")
+
+        # Create any missing indexes (no-op for ones that already exist)
+        if app.config['ENSURE_INDEXES']:
+            failed = [r for r in ensure_indexes(mongo.db) if r[2]]
+            for collection, name, error in failed:
+                print(f"❌ Index {collection}.{name} could not be created: {error}")
+    except Exception as e:
+        print(f"❌ MongoDB connection failed: {e}")
 
 
 # Enable CORS
 CORS(app)
 
+# Recently loaded users, shared across requests
+user_cache = UserCache(
+    lambda user_id: mongo.db.users.find_one({'_id': ObjectId(user_id)}),
+    max_size=app.config['USER_CACHE_SIZE'],
+    ttl=app.config['USER_CACHE_TTL']
+)
+
+# Running totals behind /api/users/stats
+community_stats = CommunityStats(mongo.db)
+if not IMAGE_WORKER:
+    try:
+        community_stats.snapshot()      # rebuilds the totals if they're missing
+    except Exception as e:
+        print(f"❌ Community stats could not be loaded: {e}")
+if app.config['STATS_RECONCILE_INTERVAL'] > 0 and not IMAGE_WORKER:
+    run_periodically(community_stats.rebuild, app.config['STATS_RECONCILE_INTERVAL'],
+                     'stats-reconciler', app.logger)
+
+# Precomputed top-K behind /api/users/trending, re-ranked on a schedule
+trending_ranker = TrendingRanker(
+    mongo.db,
+    size=app.config['TRENDING_SIZE'],
+    gravity=app.config['TRENDING_GRAVITY'],
+    view_weight=app.config['TRENDING_VIEW_WEIGHT'],
+    max_age=app.config['TRENDING_INTERVAL']
+)
+if not IMAGE_WORKER:
+    run_periodically(trending_ranker.refresh, app.config['TRENDING_INTERVAL'], 'trending-ranker', app.logger)
+
+# Likes and views are buffered in memory and written in batches (see writebehind.py)
+def record_flushed_likes(totals):
+    if totals.get('likes'):
+        community_stats.increment(total_likes=totals['likes'])
+
+if not IMAGE_WORKER:
+    counter_buffer = CounterBuffer(
+        mongo.db,
+        flush_interval=app.config['COUNTER_FLUSH_INTERVAL_MS'] / 1000,
+        max_pending=app.config['COUNTER_FLUSH_MAX_OPS'],
+        on_flush=record_flushed_likes,
+        logger=app.logger
+    )
+    atexit.register(counter_buffer.close)
+
+# Image bytes live in GridFS; documents keep file ids (see imagestore.py)
+image_store = ImageStore(mongo.db)
+
+# Images are compressed and resized in worker processes (see imaging.py)
+if not IMAGE_WORKER:
+    image_pipeline = ImagePipeline(
+        mongo.db,
+        image_store,
+        max_workers=app.config['IMAGE_WORKERS'],
+        max_queue=app.config['IMAGE_QUEUE_SIZE'],
+        logger=app.logger
+    )
+    # Drained from a threading exit hook (see ImagePipeline.close)
+    threading._register_atexit(image_pipeline.close)
+
+    # Uploads a previous run left 'processing' will never finish: their
+    # jobs and hand-off files went with it. Only old ones are touched, so
+    # uploads in flight in another server process are left alone.
+    try:
+        stale_before = datetime.utcnow() - timedelta(seconds=app.config['UPLOAD_STALE_AFTER'])
+        for collection_name in ('flowers', 'charms'):
+            mongo.db[collection_name].update_many(
+                {'status': 'processing', 'created_at': {'$lt': stale_before}},
+                {'$set': {'status': 'failed', 'error': 'Processing was interrupted'}}
+            )
+    except Exception as e:
+        print(f"❌ Stale uploads could not be checked: {e}")
+
 # Create upload folder
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'flowers'), exist_ok=True)
@@ -51,6 +161,53 @@ os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'charms'), exist_ok=True)
 # HELPER FUNCTIONS
 # ============================================
 
+# Base64 image fields from before images moved to GridFS
+# (flask migrate-images converts them into images.<key> references)
+LEGACY_IMAGE_FIELDS = ['image_data', 'image_snapshot', 'thumbnail', 'derivatives']
+
+# Image fields list endpoints leave out unless asked for,
+# clients load images separately from /api/images/<kind>/<id>
+BINARY_FIELDS = LEGACY_IMAGE_FIELDS + ['images']
+
+# Image kind (as used in image URLs) -> collection holding it
+IMAGE_COLLECTIONS = {
+    'painting': 'paintings',
+    'arrangement': 'arrangements',
+    'bracelet': 'bracelets',
+    'flower': 'flowers',
+    'charm': 'charms'
+}
+
+# Uploads still being compressed (or that failed) stay out of the pickers,
+# as do repeat uploads of an image the collection already has
+READY_UPLOADS = {'status': {'$nin': ['processing', 'failed']}, 'duplicate_of': {'$exists': False}}
+
+# Upload kind (as used in status URLs) -> collection
+UPLOAD_COLLECTIONS = {
+    'flower': 'flowers',
+    'charm': 'charms'
+}
+
+# Creation workshop_type -> image kind
+WORKSHOP_KINDS = {
+    'product_painting': 'painting',
+    'flower_arranging': 'arrangement',
+    'charm_bracelet': 'bracelet'
+}
+
+# Largest page any list endpoint returns
+MAX_PAGE_SIZE = 100
+
+# Fields /api/paintings can sort by (each has an index ending in _id)
+PAINTING_SORT_FIELDS = {'created_at', 'likes'}
+
+# Type of each field list endpoints page by, checked on incoming cursors
+CURSOR_FIELD_TYPES = {
+    'created_at': (datetime,),
+    'likes': (int, float),
+    'usage_count': (int, float)
+}
+
 def allowed_file(filename):
     # Check if file extension is allowed
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -61,12 +218,241 @@ def serialize_document(doc):
         doc['_id'] = str(doc['_id'])
         if 'creator_id' in doc:
             doc['creator_id'] = str(doc['creator_id'])
+        if 'images' in doc:
+            doc['images'] = {key: str(file_id) for key, file_id in doc['images'].items()}
     return doc
 
 def serialize_documents(docs):
     # Convert list of MongoDB documents
     return [serialize_document(doc) for doc in docs]
 
+def list_projection():
+    # Projection for list endpoints: binary fields are excluded by default.
+    # ?fields=image_data,thumbnail opts individual fields back in.
+    requested = {f.strip() for f in request.args.get('fields', '').split(',') if f.strip()}
+    return {field: 0 for field in BINARY_FIELDS if field not in requested} or None
+
+def add_image_urls(docs, kind=None):
+    # Point each serialized document at its lazily-loaded image
+    # (image_url: full size, thumbnail_url: grid-tile derivative)
+    for doc in docs:
+        doc_kind = kind or WORKSHOP_KINDS.get(doc.get('workshop_type'))
+        if doc_kind:
+            doc['image_url'] = url_for('get_image', kind=doc_kind, item_id=doc['_id'])
+            doc['thumbnail_url'] = url_for('get_image', kind=doc_kind, item_id=doc['_id'], size=256)
+    return docs
+
+def prepare_canvas_image(doc):
+    # Take a new creation's base64 canvas image off the document, decoded
+    # and recompressed for storage (SNAPSHOT_* settings). The original and
+    # stored sizes are recorded as image_info.
+    # Returns (raw bytes, mimetype), or None if the creation has no image.
+    # Raises ValueError for an undecodable image or one over the pixel budget.
+    image = None
+    for field in ('image_data', 'image_snapshot'):
+        value = doc.pop(field, None)
+        if image is None and isinstance(value, str) and value:
+            raw, _ = decode_image(value)
+            raw, mimetype, doc['image_info'] = recompress_snapshot(
+                raw,
+                snapshot_format=app.config['SNAPSHOT_FORMAT'],
+                quality=app.config['SNAPSHOT_QUALITY'],
+                max_pixels=app.config['SNAPSHOT_MAX_PIXELS'],
+                downscale=app.config['SNAPSHOT_OVERSIZE'] == 'downscale'
+            )
+            image = (raw, mimetype)
+    return image
+
+def put_canvas_image(collection_name, doc, image):
+    # Store a prepared image, leaving images.full on the (not yet inserted)
+    # document. Returns the raw bytes, or None if there is no image.
+    doc.setdefault('_id', ObjectId())
+    if image is None:
+        return None
+    file_ids = store_files(image_store, collection_name, doc['_id'], {'full': image})
+    doc['images'] = {'full': file_ids['images.full']}
+    return image[0]
+
+def store_canvas_image(collection_name, doc):
+    # Recompress and store a new creation's canvas image (see above)
+    return put_canvas_image(collection_name, doc, prepare_canvas_image(doc))
+
+def queue_derivatives(collection_name, doc, raw):
+    # Build a new creation's resized copies in the background.
+    # If the pipeline is busy the creation is still saved; its images are
+    # served full size until flask build-derivatives catches up.
+    try:
+        if raw and not image_pipeline.submit(collection_name, doc['_id'], process_snapshot, raw, failed_status=False):
+            app.logger.warning(f"Image pipeline full, skipped derivatives for {collection_name} {doc['_id']}")
+    except Exception as e:
+        # The creation is saved either way
+        app.logger.error(f"Error queueing derivatives for {collection_name} {doc['_id']}: {str(e)}")
+
+def queue_upload(collection_name, upload_id, filepath):
+    # Hand a flower or charm upload to the image pipeline.
+    # Returns False if the pipeline is full; the upload is then discarded.
+    try:
+        accepted = image_pipeline.submit(collection_name, upload_id, process_upload, filepath)
+    except Exception as e:
+        # Nothing will ever process this upload
+        mongo.db[collection_name].update_one({'_id': upload_id}, {'$set': {'status': 'failed', 'error': str(e)}})
+        os.remove(filepath)
+        raise
+    if not accepted:
+        mongo.db[collection_name].delete_one({'_id': upload_id})
+        os.remove(filepath)
+    return accepted
+
+def delete_images(doc):
+    # Remove a deleted document's files from the image store
+    # (a deduplicated upload only gives up its reference to the shared copy)
+    if doc.get('content_hash'):
+        image_store.release(doc['content_hash'])
+    else:
+        image_store.delete_all(doc.get('images') or {})
+
+def page_limit(default):
+    # ?limit=, clamped to 1..MAX_PAGE_SIZE
+    return min(max(request.args.get('limit', default=default, type=int), 1), MAX_PAGE_SIZE)
+
+def encode_cursor(doc, sort_field):
+    # Opaque next_cursor: the (sort value, _id) of the last document on a page
+    state = json_util.dumps({'v': doc.get(sort_field), 'id': doc['_id']})
+    return base64.urlsafe_b64encode(state.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, sort_field):
+    # Back to (sort value, _id); raises ValueError for a cursor this server
+    # didn't hand out. The value goes straight into a query filter, so
+    # anything but the sort field's own type (an operator document, say)
+    # is refused.
+    try:
+        state = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        value, last_id = state['v'], state['id']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+
+    valid_value = value is None or (
+        isinstance(value, CURSOR_FIELD_TYPES[sort_field]) and not isinstance(value, bool)
+    )
+    if not (valid_value and isinstance(last_id, ObjectId)):
+        raise ValueError('Invalid cursor')
+    return value, last_id
+
+def after_cursor(cursor, sort_field, direction):
+    # Filter matching everything after a cursor in (sort_field, _id) order.
+    # Documents sharing the boundary value are told apart by _id, so none
+    # are skipped.
+    value, last_id = decode_cursor(cursor, sort_field)
+    op = '$lt' if direction < 0 else '$gt'
+    after = [{sort_field: value, '_id': {op: last_id}}]
+    if value is not None:
+        after.append({sort_field: {op: value}})
+        if direction < 0:
+            # Missing values sort last descending, after every set value
+            after.append({sort_field: None})
+    elif direction > 0:
+        # Missing values sort first ascending, so every set value comes after
+        after.append({sort_field: {'$ne': None}})
+    return {'$or': after}
+
+def keyset_page(collection, filter_query, sort_field, direction, limit):
+    # One page of a list endpoint ordered by (sort_field, _id).
+    # ?cursor= continues after the last document of the previous page, so
+    # deep pages cost the same as the first one (no skip).
+    # Returns (documents, next_cursor or None once the list is exhausted)
+    query = dict(filter_query)
+    cursor = request.args.get('cursor')
+    if cursor:
+        query.update(after_cursor(cursor, sort_field, direction))
+
+    docs = list(
+        collection
+        .find(query, list_projection())
+        .sort([(sort_field, direction), ('_id', direction)])
+        .limit(limit + 1)
+    )
+
+    # Fetching one extra document tells us whether another page exists
+    next_cursor = encode_cursor(docs[limit - 1], sort_field) if len(docs) > limit else None
+    return serialize_documents(docs[:limit]), next_cursor
+
+def record_view(collection_name, doc_id):
+    # Queue a view increment.
+    # VIEW_COUNTING = 'sampled' records one view in VIEW_SAMPLE_EVERY as
+    # VIEW_SAMPLE_EVERY views, so totals stay right on average at a
+    # fraction of the writes.
+    every = app.config['VIEW_SAMPLE_EVERY']
+    if app.config['VIEW_COUNTING'] == 'sampled' and every > 1:
+        if random.randrange(every) == 0:
+            counter_buffer.add(collection_name, doc_id, 'views', every)
+    else:
+        counter_buffer.add(collection_name, doc_id, 'views')
+
+def painting_document(data):
+    # New painting from a validated POST /api/paintings body
+    return {
+        'creator_id': ObjectId(session['user_id']),
+        'workshop_type': 'product_painting',
+        'product_type': data['product_type'],
+        'canvas_size': data['canvas_size'],
+        'image_data': data['image_data'],
+        'title': data['title'],
+        'description': data.get('description', ''),
+        'colors_used': data.get('colors_used', []),
+        'brush_sizes': data.get('brush_sizes', []),
+        'creation_time': data.get('creation_time', 0),
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+        'likes': 0,
+        'views': 0,
+        'comments': []
+    }
+
+def arrangement_document(data):
+    # New arrangement from a validated POST /api/arrangements body
+    return {
+        'creator_id': ObjectId(session['user_id']),
+        'workshop_type': 'flower_arranging',
+        'arrangement_data': data['arrangement_data'],
+        'title': data['title'],
+        'description': data.get('description', ''),
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+        'likes': 0,
+        'views': 0,
+        'image_snapshot': data['image_snapshot'],
+        'comments': []
+    }
+
+def bracelet_document(data):
+    # New bracelet from a validated POST /api/bracelets body
+    return {
+        'creator_id': ObjectId(session['user_id']),
+        'workshop_type': 'charm_bracelet',
+        'bracelet_data': data['bracelet_data'],
+        'title': data['title'],
+        'description': data.get('description', ''),
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+        'likes': 0,
+        'views': 0,
+        'image_snapshot': data['image_snapshot'],
+        'comments': []
+    }
+
+# workshop_type -> (collection, stats counter, required fields, document builder)
+CREATION_TYPES = {
+    'product_painting': ('paintings', 'total_paintings',
+                         ['title', 'product_type', 'image_data', 'canvas_size'], painting_document),
+    'flower_arranging': ('arrangements', 'total_arrangements',
+                         ['title', 'arrangement_data', 'image_snapshot'], arrangement_document),
+    'charm_bracelet': ('bracelets', 'total_bracelets',
+                       ['title', 'bracelet_data', 'image_snapshot'], bracelet_document)
+}
+
+def has_required_fields(workshop_type, data):
+    return isinstance(data, dict) and all(field in data for field in CREATION_TYPES[workshop_type][2])
+
 def login_required(f):
     # Decorator to require user login
     @wraps(f)
@@ -76,21 +462,26 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def load_user(user_id):
+    # User document, loaded at most once per request
+    # (flask.g for this request, then the cross-request user_cache)
+    loaded = g.setdefault('loaded_users', {})
+    if user_id not in loaded:
+        loaded[user_id] = user_cache.get(user_id)
+    return loaded[user_id]
+
+def update_user(user_id, update):
+    # Write to a user document and drop its cached copies
+    mongo.db.users.update_one({'_id': ObjectId(user_id)}, update)
+    user_cache.invalidate(user_id)
+    g.pop('loaded_users', None)
+
 def get_current_user():
     # Get current logged-in user
     if 'user_id' in session:
-        return mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+        return load_user(session['user_id'])
     return None
 
-def compress_image(filepath, max_width=800):
-    # Compress image for storage
-    try:
-        img = Image.open(filepath)
-        img.thumbnail((max_width, max_width), Image.Resampling.LANCZOS)
-        img.save(filepath, quality=85, optimize=True)
-    except Exception as e:
-        print(f"Error compressing image: {e}")
-
 # ============================================
 # ROUTES: Authentication
 # ============================================
@@ -129,6 +520,7 @@ def register():
         }
         
         result = mongo.db.users.insert_one(new_user)
+        community_stats.increment(total_users=1)
         session['user_id'] = str(result.inserted_id)
         
         return jsonify({
@@ -163,12 +555,10 @@ def login():
             }
             result = mongo.db.users.insert_one(user)
             user['_id'] = result.inserted_id
+            community_stats.increment(total_users=1)
         else:
             # Update last login
-            mongo.db.users.update_one(
-                {'_id': user['_id']}, 
-                {'$set': {'last_login': datetime.utcnow()}}
-            )
+            update_user(str(user['_id']), {'$set': {'last_login': datetime.utcnow()}})
         
         # Store in session
         session['user_id'] = str(user['_id'])
@@ -180,10 +570,7 @@ def login():
 
 @app.context_processor
 def inject_user():
-    if 'user_id' in session:
-        user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
-        return {'user': user}
-    return {'user': None}
+    return {'user': get_current_user()}
 
 @app.route('/logout')
 def logout():
@@ -219,7 +606,10 @@ def save_painting():
         }
         
         # Insert into database
+        raw = store_canvas_image('paintings', painting)
         result = mongo.db.paintings.insert_one(painting)
+        queue_derivatives('paintings', painting, raw)
+        community_stats.increment(total_paintings=1)
         
         return jsonify({
             'status': 'success',
@@ -227,6 +617,8 @@ def save_painting():
             'id': str(result.inserted_id)
         }), 200
         
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -252,7 +644,10 @@ def save_arrangement():
             'likes': 0
         }
         
+        raw = store_canvas_image('arrangements', arrangement)
         result = mongo.db.arrangements.insert_one(arrangement)
+        queue_derivatives('arrangements', arrangement, raw)
+        community_stats.increment(total_arrangements=1)
         
         return jsonify({
             'status': 'success',
@@ -260,6 +655,8 @@ def save_arrangement():
             'id': str(result.inserted_id)
         }), 200
         
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -285,7 +682,10 @@ def save_bracelet():
             'likes': 0
         }
         
+        raw = store_canvas_image('bracelets', bracelet)
         result = mongo.db.bracelets.insert_one(bracelet)
+        queue_derivatives('bracelets', bracelet, raw)
+        community_stats.increment(total_bracelets=1)
         
         return jsonify({
             'status': 'success',
@@ -293,36 +693,72 @@ def save_bracelet():
             'id': str(result.inserted_id)
         }), 200
         
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
 @app.route('/api/creations/all', methods=['GET'])
 def get_all_creations():
-    # Get all creations from all workshops
+    # Get creations from all workshops, newest first, one page at a time
+    # Query params:
+    #   limit  - page size (default 24, max 100)
+    #   cursor - continue after the previous page (pass back next_cursor)
+    #   before - ISO timestamp; only creations older than this are returned
+    #            (older clients; skips creations sharing the boundary time)
     try:
-        # Get all paintings
-        paintings = list(mongo.db.paintings.find())
-        
-        # Get all arrangements
-        arrangements = list(mongo.db.arrangements.find())
-        
-        # Get all bracelets
-        bracelets = list(mongo.db.bracelets.find())
-        
-        # Combine all creations
-        all_creations = paintings + arrangements + bracelets
-        
-        # Convert ObjectId to string
-        for creation in all_creations:
-            creation['_id'] = str(creation['_id'])
-        
-        # Sort by created_at (newest first)
-        all_creations.sort(key=lambda x: x.get('created_at', datetime.min), reverse=True)
-        
+        limit = min(max(request.args.get('limit', default=24, type=int), 1), 100)
+        before = request.args.get('before')
+        cursor = request.args.get('cursor')
+
+        match = {}
+        if cursor:
+            try:
+                match = after_cursor(cursor, 'created_at', -1)
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+        elif before:
+            try:
+                match['created_at'] = {'$lt': datetime.fromisoformat(before)}
+            except ValueError:
+                return jsonify({'status': 'error', 'message': 'Invalid before timestamp'}), 400
+
+        # Each collection contributes at most `limit + 1` of its newest
+        # documents (ordered by created_at, then _id, like the cursor), then
+        # the three sorted runs are merged inside MongoDB. The extra document
+        # tells us whether another page exists.
+        newest = [
+            {'$match': match},
+            {'$sort': {'created_at': -1, '_id': -1}},
+            {'$limit': limit + 1}
+        ]
+        projection = list_projection()
+        if projection:
+            newest.append({'$project': projection})
+        pipeline = newest + [
+            {'$unionWith': {'coll': 'arrangements', 'pipeline': newest}},
+            {'$unionWith': {'coll': 'bracelets', 'pipeline': newest}},
+            {'$sort': {'created_at': -1, '_id': -1}},
+            {'$limit': limit + 1}
+        ]
+
+        docs = list(mongo.db.paintings.aggregate(pipeline))
+
+        # Cursors for the next page (None once the feed is exhausted)
+        next_cursor, next_before = None, None
+        if len(docs) > limit:
+            next_cursor = encode_cursor(docs[limit - 1], 'created_at')
+            if docs[limit - 1].get('created_at'):
+                next_before = docs[limit - 1]['created_at'].isoformat()
+
+        all_creations = add_image_urls(serialize_documents(docs[:limit]))
+
         return jsonify({
             'status': 'success',
-            'creations': all_creations
+            'creations': all_creations,
+            'next_cursor': next_cursor,
+            'next_before': next_before
         }), 200
         
     except Exception as e:
@@ -330,6 +766,68 @@ def get_all_creations():
 
 
 
+@app.route('/api/creations/batch', methods=['POST'])
+@login_required
+def save_creations_batch():
+    # Save many creations of any workshop type in one request
+    # Body: {"creations": [{"workshop_type": "product_painting", ...}, ...]}
+    # Each item takes the same fields as POST /api/paintings, /api/arrangements
+    # or /api/bracelets. Nothing is saved unless every item is valid.
+    # Writes: each image to GridFS, then one insert_many per collection plus
+    # one update per counter.
+    try:
+        data = request.get_json()
+        items = data.get('creations') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({'status': 'error', 'message': 'No creations provided'}), 400
+        if len(items) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({'status': 'error', 'message': f"At most {app.config['MAX_BATCH_SIZE']} creations per batch"}), 400
+        
+        # Validate everything before writing anything
+        for index, item in enumerate(items):
+            workshop_type = item.get('workshop_type') if isinstance(item, dict) else None
+            if workshop_type not in CREATION_TYPES:
+                return jsonify({'status': 'error', 'message': f'Creation {index}: invalid workshop type'}), 400
+            if not has_required_fields(workshop_type, item):
+                return jsonify({'status': 'error', 'message': f'Creation {index}: missing required fields'}), 400
+        
+        # Group by collection, remembering each item's position in the request
+        groups = {}
+        for index, item in enumerate(items):
+            build = CREATION_TYPES[item['workshop_type']][3]
+            groups.setdefault(item['workshop_type'], []).append((index, build(item)))
+        
+        # Recompress every image up front too: one over the pixel budget
+        # fails the batch before anything is stored
+        prepared = {index: prepare_canvas_image(doc) for group in groups.values() for index, doc in group}
+        
+        ids = [None] * len(items)
+        counters = {}
+        for workshop_type, group in groups.items():
+            collection_name, counter = CREATION_TYPES[workshop_type][:2]
+            images = [put_canvas_image(collection_name, doc, prepared[index]) for index, doc in group]
+            result = mongo.db[collection_name].insert_many([doc for _, doc in group])
+            for (_, doc), raw in zip(group, images):
+                queue_derivatives(collection_name, doc, raw)
+            for (index, _), inserted_id in zip(group, result.inserted_ids):
+                ids[index] = str(inserted_id)
+            counters[counter] = len(group)
+        
+        community_stats.increment(**counters)
+        update_user(session['user_id'], {'$inc': {'total_creations': len(items)}})
+        
+        return jsonify({
+            'status': 'success',
+            'message': f'{len(items)} creations saved successfully',
+            'ids': ids
+        }), 201
+    
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error saving creation batch: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 # ============================================
 # ROUTES: Workshops
 # ============================================
@@ -344,14 +842,14 @@ def product_painting_workshop():
 @login_required
 def flower_arranging_workshop():
     # Flower arranging workshop interface
-    flowers = serialize_documents(mongo.db.flowers.find())
+    flowers = serialize_documents(mongo.db.flowers.find(READY_UPLOADS))
     return render_template('workshops/flower-arrange.html', flowers=flowers)
 
 @app.route('/workshop/charm-bracelet')
 @login_required
 def charm_bracelet_workshop():
     # Charm bracelet workshop interface
-    charms = serialize_documents(mongo.db.charms.find())
+    charms = serialize_documents(mongo.db.charms.find(READY_UPLOADS))
     return render_template('workshops/charm-bracelet.html', charms=charms)
 
 # ============================================
@@ -402,36 +900,19 @@ def create_painting():
         data = request.get_json()
         
         # Validate required fields
-        required = ['title', 'product_type', 'image_data', 'canvas_size']
-        if not all(field in data for field in required):
+        if not has_required_fields('product_painting', data):
             return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
         
         # Create painting document
-        painting = {
-            'creator_id': ObjectId(session['user_id']),
-            'workshop_type': 'product_painting',
-            'product_type': data['product_type'],
-            'canvas_size': data['canvas_size'],
-            'image_data': data['image_data'],
-            'title': data['title'],
-            'description': data.get('description', ''),
-            'colors_used': data.get('colors_used', []),
-            'brush_sizes': data.get('brush_sizes', []),
-            'creation_time': data.get('creation_time', 0),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-            'likes': 0,
-            'views': 0,
-            'comments': []
-        }
+        painting = painting_document(data)
         
+        raw = store_canvas_image('paintings', painting)
         result = mongo.db.paintings.insert_one(painting)
+        queue_derivatives('paintings', painting, raw)
+        community_stats.increment(total_paintings=1)
         
         # Update user creation count
-        mongo.db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$inc': {'total_creations': 1}}
-        )
+        update_user(session['user_id'], {'$inc': {'total_creations': 1}})
         
         return jsonify({
             'status': 'success',
@@ -439,6 +920,8 @@ def create_painting():
             'painting_id': str(result.inserted_id)
         }), 201
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         app.logger.error(f"Error creating painting: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -446,11 +929,13 @@ def create_painting():
 @app.route('/api/paintings', methods=['GET'])
 def get_paintings():
     #Retrieve paintings with optional filters
+    # Query params:
+    #   cursor        - next_cursor from the previous page
+    #   include_total - 1 to also count every matching painting (slower)
     try:
         # Get query parameters
         product_type = request.args.get('product_type')
-        limit = request.args.get('limit', default=20, type=int)
-        offset = request.args.get('offset', default=0, type=int)
+        limit = page_limit(20)
         sort_by = request.args.get('sort_by', default='-created_at')
         
         # Build filter
@@ -458,29 +943,33 @@ def get_paintings():
         if product_type:
             filter_query['product_type'] = product_type
         
-        # Get total count
-        total = mongo.db.paintings.count_documents(filter_query)
-        
         # Parse sort
         sort_field = sort_by.lstrip('-')
         sort_direction = -1 if sort_by.startswith('-') else 1
+        if sort_field not in PAINTING_SORT_FIELDS:
+            return jsonify({'status': 'error', 'message': 'Invalid sort field'}), 400
         
         # Query paintings
-        paintings = serialize_documents(
-            mongo.db.paintings
-            .find(filter_query)
-            .sort(sort_field, sort_direction)
-            .skip(offset)
-            .limit(limit)
+        paintings, next_cursor = keyset_page(
+            mongo.db.paintings, filter_query, sort_field, sort_direction, limit
         )
+        add_image_urls(paintings)
         
-        return jsonify({
+        response = {
             'status': 'success',
             'paintings': paintings,
-            'total': total,
-            'returned': len(paintings)
-        }), 200
+            'returned': len(paintings),
+            'next_cursor': next_cursor
+        }
+        
+        # Exact total only on request: it scans every matching index entry
+        if request.args.get('include_total') == '1':
+            response['total'] = mongo.db.paintings.count_documents(filter_query)
+        
+        return jsonify(response), 200
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -492,12 +981,10 @@ def get_painting(painting_id):
         
         if not painting:
             return jsonify({'status': 'error', 'message': 'Painting not found'}), 404
+        add_image_urls([painting], 'painting')
         
-        # Increment views
-        mongo.db.paintings.update_one(
-            {'_id': ObjectId(painting_id)},
-            {'$inc': {'views': 1}}
-        )
+        # Count the view in the background (batched with likes)
+        record_view('paintings', ObjectId(painting_id))
         
         return jsonify({
             'status': 'success',
@@ -521,13 +1008,13 @@ def delete_painting(painting_id):
         if str(painting['creator_id']) != session['user_id']:
             return jsonify({'status': 'error', 'message': 'Unauthorized'}), 403
         
-        mongo.db.paintings.delete_one({'_id': ObjectId(painting_id)})
+        result = mongo.db.paintings.delete_one({'_id': ObjectId(painting_id)})
+        if result.deleted_count:
+            community_stats.increment(total_paintings=-1, total_likes=-painting.get('likes', 0))
+            delete_images(painting)
         
         # Decrement user creation count
-        mongo.db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$inc': {'total_creations': -1}}
-        )
+        update_user(session['user_id'], {'$inc': {'total_creations': -1}})
         
         return jsonify({'status': 'success', 'message': 'Painting deleted'}), 200
     
@@ -556,38 +1043,33 @@ def upload_flower():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'flowers', filename)
         file.save(filepath)
         
-        # Compress if image
-        if filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}:
-            compress_image(filepath)
-        
-        # Read file as base64
-        with open(filepath, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
-        
         # Create flower document
         flower = {
             'name': request.form.get('name', 'Custom Flower'),
-            'image_data': image_data,
             'uploader_id': ObjectId(session['user_id']),
             'is_preset': False,
+            'status': 'processing',
             'created_at': datetime.utcnow(),
-            'usage_count': 0,
-            'thumbnail': image_data  # Same as full image for now
+            'usage_count': 0
         }
         
         result = mongo.db.flowers.insert_one(flower)
         
+        # Compress and store in the background; the document turns 'ready' when done
+        if not queue_upload('flowers', result.inserted_id, filepath):
+            return jsonify({'status': 'error', 'message': 'Too many uploads in progress, try again shortly'}), 503
+        community_stats.increment(total_uploads=1)
+        
         # Update user upload count
-        mongo.db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$inc': {'total_uploads': 1}}
-        )
+        update_user(session['user_id'], {'$inc': {'total_uploads': 1}})
         
         return jsonify({
             'status': 'success',
-            'message': 'Flower uploaded successfully',
-            'flower_id': str(result.inserted_id)
-        }), 201
+            'message': 'Flower uploaded, processing',
+            'flower_id': str(result.inserted_id),
+            'processing_status': 'processing',
+            'status_url': url_for('get_upload_status', kind='flower', item_id=str(result.inserted_id))
+        }), 202
     
     except Exception as e:
         app.logger.error(f"Error uploading flower: {str(e)}")
@@ -597,22 +1079,19 @@ def upload_flower():
 def get_flowers():
     # Get all available flowers
     try:
-        limit = request.args.get('limit', default=50, type=int)
-        offset = request.args.get('offset', default=0, type=int)
-        
-        flowers = serialize_documents(
-            mongo.db.flowers
-            .find()
-            .sort('usage_count', -1)
-            .skip(offset)
-            .limit(limit)
-        )
+        limit = page_limit(50)
+        
+        flowers, next_cursor = keyset_page(mongo.db.flowers, READY_UPLOADS, 'usage_count', -1, limit)
+        add_image_urls(flowers, 'flower')
         
         return jsonify({
             'status': 'success',
-            'flowers': flowers
+            'flowers': flowers,
+            'next_cursor': next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -638,39 +1117,34 @@ def upload_charm():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], 'charms', filename)
         file.save(filepath)
         
-        # Compress if image
-        if filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}:
-            compress_image(filepath)
-        
-        # Read file as base64
-        with open(filepath, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
-        
         # Create charm document
         charm = {
             'name': request.form.get('name', 'Custom Charm'),
-            'image_data': image_data,
             'uploader_id': ObjectId(session['user_id']),
             'is_preset': False,
+            'status': 'processing',
             'created_at': datetime.utcnow(),
             'usage_count': 0,
-            'thumbnail': image_data,
             'shape': request.form.get('shape', 'circle')
         }
         
         result = mongo.db.charms.insert_one(charm)
         
+        # Compress and store in the background; the document turns 'ready' when done
+        if not queue_upload('charms', result.inserted_id, filepath):
+            return jsonify({'status': 'error', 'message': 'Too many uploads in progress, try again shortly'}), 503
+        community_stats.increment(total_uploads=1)
+        
         # Update user upload count
-        mongo.db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$inc': {'total_uploads': 1}}
-        )
+        update_user(session['user_id'], {'$inc': {'total_uploads': 1}})
         
         return jsonify({
             'status': 'success',
-            'message': 'Charm uploaded successfully',
-            'charm_id': str(result.inserted_id)
-        }), 201
+            'message': 'Charm uploaded, processing',
+            'charm_id': str(result.inserted_id),
+            'processing_status': 'processing',
+            'status_url': url_for('get_upload_status', kind='charm', item_id=str(result.inserted_id))
+        }), 202
     
     except Exception as e:
         app.logger.error(f"Error uploading charm: {str(e)}")
@@ -680,22 +1154,19 @@ def upload_charm():
 def get_charms():
     # Get all available charms
     try:
-        limit = request.args.get('limit', default=50, type=int)
-        offset = request.args.get('offset', default=0, type=int)
-        
-        charms = serialize_documents(
-            mongo.db.charms
-            .find()
-            .sort('usage_count', -1)
-            .skip(offset)
-            .limit(limit)
-        )
+        limit = page_limit(50)
+        
+        charms, next_cursor = keyset_page(mongo.db.charms, READY_UPLOADS, 'usage_count', -1, limit)
+        add_image_urls(charms, 'charm')
         
         return jsonify({
             'status': 'success',
-            'charms': charms
+            'charms': charms,
+            'next_cursor': next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -710,30 +1181,17 @@ def create_arrangement():
     try:
         data = request.get_json()
         
-        required = ['title', 'arrangement_data', 'image_snapshot']
-        if not all(field in data for field in required):
+        if not has_required_fields('flower_arranging', data):
             return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
         
-        arrangement = {
-            'creator_id': ObjectId(session['user_id']),
-            'workshop_type': 'flower_arranging',
-            'arrangement_data': data['arrangement_data'],
-            'title': data['title'],
-            'description': data.get('description', ''),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-            'likes': 0,
-            'views': 0,
-            'image_snapshot': data['image_snapshot'],
-            'comments': []
-        }
+        arrangement = arrangement_document(data)
         
+        raw = store_canvas_image('arrangements', arrangement)
         result = mongo.db.arrangements.insert_one(arrangement)
+        queue_derivatives('arrangements', arrangement, raw)
+        community_stats.increment(total_arrangements=1)
         
-        mongo.db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$inc': {'total_creations': 1}}
-        )
+        update_user(session['user_id'], {'$inc': {'total_creations': 1}})
         
         return jsonify({
             'status': 'success',
@@ -741,6 +1199,8 @@ def create_arrangement():
             'arrangement_id': str(result.inserted_id)
         }), 201
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -748,22 +1208,19 @@ def create_arrangement():
 def get_arrangements():
     # Get all arrangements
     try:
-        limit = request.args.get('limit', default=20, type=int)
-        offset = request.args.get('offset', default=0, type=int)
-        
-        arrangements = serialize_documents(
-            mongo.db.arrangements
-            .find()
-            .sort('created_at', -1)
-            .skip(offset)
-            .limit(limit)
-        )
+        limit = page_limit(20)
+        
+        arrangements, next_cursor = keyset_page(mongo.db.arrangements, {}, 'created_at', -1, limit)
+        add_image_urls(arrangements, 'arrangement')
         
         return jsonify({
             'status': 'success',
-            'arrangements': arrangements
+            'arrangements': arrangements,
+            'next_cursor': next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -778,30 +1235,17 @@ def create_bracelet():
     try:
         data = request.get_json()
         
-        required = ['title', 'bracelet_data', 'image_snapshot']
-        if not all(field in data for field in required):
+        if not has_required_fields('charm_bracelet', data):
             return jsonify({'status': 'error', 'message': 'Missing required fields'}), 400
         
-        bracelet = {
-            'creator_id': ObjectId(session['user_id']),
-            'workshop_type': 'charm_bracelet',
-            'bracelet_data': data['bracelet_data'],
-            'title': data['title'],
-            'description': data.get('description', ''),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow(),
-            'likes': 0,
-            'views': 0,
-            'image_snapshot': data['image_snapshot'],
-            'comments': []
-        }
+        bracelet = bracelet_document(data)
         
+        raw = store_canvas_image('bracelets', bracelet)
         result = mongo.db.bracelets.insert_one(bracelet)
+        queue_derivatives('bracelets', bracelet, raw)
+        community_stats.increment(total_bracelets=1)
         
-        mongo.db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$inc': {'total_creations': 1}}
-        )
+        update_user(session['user_id'], {'$inc': {'total_creations': 1}})
         
         return jsonify({
             'status': 'success',
@@ -809,6 +1253,8 @@ def create_bracelet():
             'bracelet_id': str(result.inserted_id)
         }), 201
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -816,22 +1262,134 @@ def create_bracelet():
 def get_bracelets():
     # Get all bracelets
     try:
-        limit = request.args.get('limit', default=20, type=int)
-        offset = request.args.get('offset', default=0, type=int)
-        
-        bracelets = serialize_documents(
-            mongo.db.bracelets
-            .find()
-            .sort('created_at', -1)
-            .skip(offset)
-            .limit(limit)
-        )
+        limit = page_limit(20)
+        
+        bracelets, next_cursor = keyset_page(mongo.db.bracelets, {}, 'created_at', -1, limit)
+        add_image_urls(bracelets, 'bracelet')
         
         return jsonify({
             'status': 'success',
-            'bracelets': bracelets
+            'bracelets': bracelets,
+            'next_cursor': next_cursor
         }), 200
     
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/uploads/<kind>/<item_id>/status', methods=['GET'])
+def get_upload_status(kind, item_id):
+    # Poll a flower or charm upload until processing finishes
+    # status: 'processing', 'ready' or 'failed' (uploads from before the
+    # pipeline have no status and are reported as 'ready')
+    try:
+        collection_name = UPLOAD_COLLECTIONS.get(kind)
+        if not collection_name:
+            return jsonify({'status': 'error', 'message': 'Invalid upload kind'}), 400
+        
+        upload = mongo.db[collection_name].find_one(
+            {'_id': ObjectId(item_id)},
+            {'status': 1, 'processing_ms': 1, 'error': 1, 'duplicate_of': 1}
+        )
+        if not upload:
+            return jsonify({'status': 'error', 'message': 'Upload not found'}), 404
+        
+        processing_status = upload.get('status', 'ready')
+        response = {
+            'status': 'success',
+            'processing_status': processing_status,
+            'processing_ms': upload.get('processing_ms')
+        }
+        if processing_status == 'ready':
+            # A repeat upload resolves to the entry the pickers already list
+            image_id = str(upload.get('duplicate_of') or item_id)
+            response['image_url'] = url_for('get_image', kind=kind, item_id=image_id)
+            if upload.get('duplicate_of'):
+                response['duplicate_of'] = image_id
+        elif processing_status == 'failed':
+            response['error'] = upload.get('error')
+        
+        return jsonify(response), 200
+    
+    except InvalidId:
+        return jsonify({'status': 'error', 'message': 'Upload not found'}), 404
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# ============================================
+# API: Images
+# ============================================
+
+def stream_image(file_id):
+    # Stream a stored file chunk by chunk.
+    # A file id always names the same bytes, so it serves as the ETag and
+    # browsers may keep the response for good.
+    etag = str(file_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        chunks, length, mimetype = image_store.stream(file_id)
+        response = Response(chunks, mimetype=mimetype, direct_passthrough=True)
+        response.content_length = length
+
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/images/<kind>/<item_id>', methods=['GET'])
+def get_image(kind, item_id):
+    # Serve one creation's or upload's image as raw bytes
+    # List endpoints only carry this URL, so the gallery fetches images
+    # lazily as cards scroll into view
+    # Query params:
+    #   size    - longest side wanted in px; served from the smallest stored
+    #             derivative at least that big (default: full image)
+    #   variant - 'thumbnail' for flowers and charms
+    # Falls back to the full image while derivatives haven't been built
+    try:
+        collection_name = IMAGE_COLLECTIONS.get(kind)
+        if not collection_name:
+            return jsonify({'status': 'error', 'message': 'Invalid image kind'}), 400
+
+        # Image keys to try, best match first
+        keys = []
+        size = request.args.get('size', type=int)
+        if size:
+            derivative = next((s for s in DERIVATIVE_SIZES if s >= size), None)
+            if derivative:
+                keys.append(str(derivative))
+        if request.args.get('variant') == 'thumbnail':
+            keys += ['thumbnail', '256']
+        keys.append('full')
+
+        projection = {field: 1 for field in BINARY_FIELDS}
+        doc = mongo.db[collection_name].find_one({'_id': ObjectId(item_id)}, projection) or {}
+
+        images = doc.get('images') or {}
+        file_id = next((images[key] for key in keys if key in images), None)
+        if file_id is not None:
+            return stream_image(file_id)
+
+        # Not migrated to the image store yet: serve the base64 field
+        legacy = {'thumbnail': doc.get('thumbnail'), 'full': doc.get('image_data') or doc.get('image_snapshot')}
+        legacy.update(doc.get('derivatives') or {})
+        value = next((legacy[key] for key in keys if legacy.get(key)), None)
+        if not value:
+            return jsonify({'status': 'error', 'message': 'Image not found'}), 404
+
+        raw, mimetype = decode_image(value)
+        response = Response(raw, mimetype=mimetype)
+        response.set_etag(hashlib.sha256(raw).hexdigest())
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+        return response.make_conditional(request)
+
+    except (InvalidId, NoFile):
+        # Malformed id, or a reference to a file that has since been deleted
+        return jsonify({'status': 'error', 'message': 'Image not found'}), 404
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -842,16 +1400,14 @@ def get_bracelets():
 @app.route('/api/users/trending', methods=['GET'])
 def get_trending():
     #Get trending creations
+    # Served from the precomputed ranking (likes and views decayed by age,
+    # merged across all workshops), see trending.py
     try:
-        limit = request.args.get('limit', default=12, type=int)
+        limit = min(max(request.args.get('limit', default=12, type=int), 1), app.config['TRENDING_SIZE'])
         
-        # Get trending creations from all types
-        paintings = list(mongo.db.paintings.find().sort('likes', -1).limit(limit // 3))
-        arrangements = list(mongo.db.arrangements.find().sort('likes', -1).limit(limit // 3))
-        bracelets = list(mongo.db.bracelets.find().sort('likes', -1).limit(limit // 3))
-        
-        trending = paintings + arrangements + bracelets
-        trending = serialize_documents(trending)
+        # Copies, since serializing rewrites _id on the shared ranking
+        trending = [dict(item) for item in trending_ranker.top(limit)]
+        trending = add_image_urls(serialize_documents(trending))
         
         return jsonify({
             'status': 'success',
@@ -863,20 +1419,9 @@ def get_trending():
 
 @app.route('/api/users/stats', methods=['GET'])
 def get_community_stats():
-    # Get community statistics
+    # Get community statistics (one read of the running totals in db.stats)
     try:
-        stats = {
-            'total_paintings': mongo.db.paintings.count_documents({}),
-            'total_arrangements': mongo.db.arrangements.count_documents({}),
-            'total_bracelets': mongo.db.bracelets.count_documents({}),
-            'total_users': mongo.db.users.count_documents({}),
-            'total_uploads': mongo.db.flowers.count_documents({}) + mongo.db.charms.count_documents({}),
-            'total_likes': (
-                sum(p['likes'] for p in mongo.db.paintings.find()) +
-                sum(a['likes'] for a in mongo.db.arrangements.find()) +
-                sum(b['likes'] for b in mongo.db.bracelets.find())
-            )
-        }
+        stats = community_stats.snapshot()
         
         return jsonify({
             'status': 'success',
@@ -890,34 +1435,49 @@ def get_community_stats():
 @login_required
 def like_creation(creation_id):
     #Like a creation#
+    # The increment is buffered and written with other likes in one
+    # bulk_write shortly after (a like on a missing id is dropped then)
     try:
         data = request.get_json()
         creation_type = data.get('creation_type')
         
         # Determine collection
         collection_map = {
-            'painting': mongo.db.paintings,
-            'arrangement': mongo.db.arrangements,
-            'bracelet': mongo.db.bracelets
+            'painting': 'paintings',
+            'arrangement': 'arrangements',
+            'bracelet': 'bracelets'
         }
         
-        collection = collection_map.get(creation_type)
-        if not collection:
+        collection_name = collection_map.get(creation_type)
+        if collection_name is None:
             return jsonify({'status': 'error', 'message': 'Invalid creation type'}), 400
         
-        result = collection.update_one(
-            {'_id': ObjectId(creation_id)},
-            {'$inc': {'likes': 1}}
-        )
-        
-        if result.matched_count:
-            return jsonify({'status': 'success', 'message': 'Liked successfully'}), 200
+        if not ObjectId.is_valid(creation_id):
+            return jsonify({'status': 'error', 'message': 'Creation not found'}), 404
         
-        return jsonify({'status': 'error', 'message': 'Creation not found'}), 404
+        counter_buffer.add(collection_name, ObjectId(creation_id), 'likes')
+        return jsonify({'status': 'success', 'message': 'Liked successfully'}), 200
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    # Inspect the user cache (hit/miss/eviction counters)
+    return jsonify({
+        'status': 'success',
+        'users': user_cache.stats()
+    }), 200
+
+@app.route('/api/queue-stats', methods=['GET'])
+def queue_stats():
+    # Inspect the background queues: write-behind counters and upload processing
+    return jsonify({
+        'status': 'success',
+        'counters': counter_buffer.stats(),
+        'images': image_pipeline.stats()
+    }), 200
+
 # ============================================
 # ERROR HANDLERS
 # ============================================
@@ -930,6 +1490,137 @@ def not_found(error):
 def internal_error(error):
     return "Internal server error", 500
 
+# ============================================
+# CLI COMMANDS
+# ============================================
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    # flask --app server ensure-indexes
+    # Create every index in indexes.INDEXES that doesn't exist yet
+    failed = 0
+    for collection, name, error in ensure_indexes(mongo.db):
+        print(f"  {'FAIL' if error else 'ok  '} {collection}.{name}" + (f": {error}" if error else ''))
+        failed += bool(error)
+
+    if failed:
+        sys.exit(1)
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    # flask --app server check-indexes
+    # Explain each route's canonical query; exits non-zero if any scans a whole collection
+    scans = 0
+    for label, stages, collscan in check_query_plans(mongo.db):
+        print(f"  {'COLLSCAN' if collscan else 'ok      '} {label}: {' <- '.join(stages)}")
+        scans += collscan
+
+    if scans:
+        print(f"{scans} queries scan a whole collection (run flask --app server ensure-indexes)")
+        sys.exit(1)
+
+@app.cli.command('build-derivatives')
+def build_derivatives_command():
+    # flask --app server build-derivatives
+    # Create resized copies for stored images that don't have them
+    # (saved before derivatives existed, or skipped while the pipeline was
+    # full). Run migrate-images first for base64 images.
+    built, failed = 0, 0
+    for collection_name in IMAGE_COLLECTIONS.values():
+        missing = mongo.db[collection_name].find(
+            {'images.full': {'$exists': True}, 'images.256': {'$exists': False}},
+            {'images': 1}
+        )
+        for doc in missing:
+            try:
+                files = process_snapshot(image_store.read(doc['images']['full']))['files']
+            except Exception as e:
+                print(f"  FAIL {collection_name} {doc['_id']}: {e}")
+                failed += 1
+                continue
+            if files:
+                fields = store_files(image_store, collection_name, doc['_id'], files)
+                mongo.db[collection_name].update_one({'_id': doc['_id']}, {'$set': fields})
+                built += 1
+
+    print(f"Built derivatives for {built} images ({failed} failed)")
+
+@app.cli.command('migrate-images')
+def migrate_images_command():
+    # flask --app server migrate-images
+    # Move base64 image fields (image_data, image_snapshot, thumbnail,
+    # derivatives) into the image store, leaving images.<key> references.
+    # Safe to re-run: documents already migrated have no base64 fields left.
+    migrated, failed, bytes_moved = 0, 0, 0
+    legacy_query = {'$or': [{field: {'$type': ['string', 'object']}} for field in LEGACY_IMAGE_FIELDS]}
+
+    for collection_name in IMAGE_COLLECTIONS.values():
+        for doc in mongo.db[collection_name].find(legacy_query, {field: 1 for field in BINARY_FIELDS}):
+            try:
+                files = {}
+                image = doc.get('image_data') or doc.get('image_snapshot')
+                if isinstance(image, str) and image:
+                    files['full'] = decode_image(image)
+                if isinstance(doc.get('thumbnail'), str) and doc['thumbnail'] and doc['thumbnail'] != image:
+                    files['thumbnail'] = decode_image(doc['thumbnail'])
+                for key, value in (doc.get('derivatives') or {}).items():
+                    files[key] = decode_image(value)
+            except ValueError as e:
+                print(f"  FAIL {collection_name} {doc['_id']}: {e}")
+                failed += 1
+                continue
+
+            fields = store_files(image_store, collection_name, doc['_id'], files)
+            mongo.db[collection_name].update_one(
+                {'_id': doc['_id']},
+                {'$set': fields, '$unset': {field: '' for field in LEGACY_IMAGE_FIELDS}}
+            )
+            migrated += 1
+            bytes_moved += sum(len(raw) for raw, _ in files.values())
+
+    print(f"Migrated {migrated} documents ({bytes_moved} bytes of images, {failed} failed)")
+
+@app.cli.command('dedupe-uploads')
+def dedupe_uploads_command():
+    # flask --app server dedupe-uploads
+    # Hash flowers and charms stored before uploads were deduplicated and
+    # fold identical ones onto one shared copy. Run after migrate-images.
+    linked, duplicates, failed = 0, 0, 0
+    for collection_name in UPLOAD_COLLECTIONS.values():
+        pending = mongo.db[collection_name].find(
+            {'images.full': {'$exists': True}, 'content_hash': {'$exists': False}},
+            {'images': 1}
+        ).sort('_id', 1)
+        for doc in pending:
+            try:
+                digest = content_hash(image_store.read(doc['images']['full']))
+            except Exception as e:
+                print(f"  FAIL {collection_name} {doc['_id']}: {e}")
+                failed += 1
+                continue
+
+            images = image_store.share(digest, doc['images'])
+            fields = shared_upload_fields(mongo.db, collection_name, doc['_id'], digest, images)
+            mongo.db[collection_name].update_one({'_id': doc['_id']}, {'$set': fields})
+            linked += 1
+            duplicates += 'duplicate_of' in fields
+
+    print(f"Hashed {linked} uploads ({duplicates} duplicates folded, {failed} failed)")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    # flask --app server rebuild-stats
+    # Recount community statistics from the collections and report any drift
+    before = community_stats.snapshot()
+    after = community_stats.rebuild()
+
+    if before == after:
+        print(f"Stats verified: running totals match ({json.dumps(after)})")
+    else:
+        print("Stats rebuilt: running totals had drifted")
+        print(f"  before: {json.dumps(before)}")
+        print(f"  after:  {json.dumps(after)}")
+
 # ============================================
 # RUN APPLICATION
 # ============================================
@@ -99,6 +99,25 @@ class APIClient {
     return this.request(`/charms?limit=${limit}`);
   }
 
+  // ============ UPLOAD PROCESSING ============
+
+  // Uploads are compressed in the background; kind is 'flower' or 'charm'
+  async getUploadStatus(kind, id) {
+    return this.request(`/uploads/${kind}/${id}/status`);
+  }
+
+  async waitForUpload(kind, id, interval = 500, timeout = 30000) {
+    const deadline = Date.now() + timeout;
+    while (Date.now() < deadline) {
+      const status = await this.getUploadStatus(kind, id);
+      if (status.processing_status !== 'processing') {
+        return status;
+      }
+      await new Promise(resolve => setTimeout(resolve, interval));
+    }
+    throw new Error('Upload is still processing');
+  }
+
   // ============ ARRANGEMENTS ============
   
   async saveArrangement(arrangementData) {
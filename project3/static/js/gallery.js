@@ -1,13 +1,29 @@
 // Gallery - Load and display all creations from database
 let allCreations = [];
 let currentFilter = 'all';
+let nextCursor = null;   // Cursor for the next page (null when there are no more)
 
 document.addEventListener('DOMContentLoaded', function() {
   loadGallery();
   setupFilters();
   setupModal();
+  document.getElementById('loadMoreBtn')?.addEventListener('click', loadMore);
 });
 
+async function fetchCreationsPage(cursor) {
+  // One page of the unified feed, newest first
+  const params = new URLSearchParams({ limit: 24 });
+  if (cursor) params.set('cursor', cursor);
+
+  const response = await fetch(`/api/creations/all?${params}`);
+  return await response.json();
+}
+
+function updateLoadMore() {
+  const loadMoreBtn = document.getElementById('loadMoreBtn');
+  if (loadMoreBtn) loadMoreBtn.style.display = nextCursor ? 'inline-block' : 'none';
+}
+
 async function loadGallery() {
   const loadingEl = document.getElementById('loadingIndicator');
   const gridEl = document.getElementById('galleryGrid');
@@ -17,18 +33,20 @@ async function loadGallery() {
     loadingEl.style.display = 'flex';
     gridEl.innerHTML = '';
 
-    const response = await fetch('/api/creations/all');
-    const data = await response.json();
+    const data = await fetchCreationsPage(null);
 
     loadingEl.style.display = 'none';
 
     if (data.status === 'success' && data.creations && data.creations.length > 0) {
       allCreations = data.creations;
+      nextCursor = data.next_cursor;
       renderCreations(allCreations);
       noItemsEl.style.display = 'none';
     } else {
+      nextCursor = null;
       noItemsEl.style.display = 'block';
     }
+    updateLoadMore();
   } catch (error) {
     console.error('Error loading gallery:', error);
     loadingEl.style.display = 'none';
@@ -36,6 +54,22 @@ async function loadGallery() {
   }
 }
 
+async function loadMore() {
+  if (!nextCursor) return;
+
+  try {
+    const data = await fetchCreationsPage(nextCursor);
+    if (data.status === 'success') {
+      allCreations = allCreations.concat(data.creations);
+      nextCursor = data.next_cursor;
+      renderCreations(allCreations);
+    }
+    updateLoadMore();
+  } catch (error) {
+    console.error('Error loading more creations:', error);
+  }
+}
+
 function renderCreations(creations) {
   const grid = document.getElementById('galleryGrid');
   grid.innerHTML = '';
@@ -77,7 +111,7 @@ function createCard(creation, index) {
 
   card.innerHTML = `
     <div class="gallery-item-image">
-      <img src="${creation.image_data || creation.image_snapshot || ''}" alt="${creation.title || 'Creation'}">
+      <img src="${creationImageUrl(creation, true)}" alt="${creation.title || 'Creation'}" loading="lazy">
       <div class="workshop-type-badge">
         ${workshopEmoji[creation.workshop_type] || '🎨'} 
         ${getWorkshopName(creation.workshop_type)}
@@ -97,6 +131,13 @@ function createCard(creation, index) {
   return card;
 }
 
+function creationImageUrl(creation, thumbnail = false) {
+  // List responses carry a URL instead of the base64 image itself
+  // (grid cards use the small derivative, the modal the full image)
+  const url = thumbnail ? creation.thumbnail_url || creation.image_url : creation.image_url;
+  return url || creation.image_data || creation.image_snapshot || '';
+}
+
 function getWorkshopName(type) {
   const names = {
     'product_painting': 'Painting',
@@ -167,7 +208,7 @@ function showModal(creation) {
   });
 
   modalBody.innerHTML = `
-    <img src="${creation.image_data || creation.image_snapshot || ''}" 
+    <img src="${creationImageUrl(creation)}" 
          alt="${creation.title}" 
          class="modal-creation-image">
     
@@ -0,0 +1,79 @@
+# PROJECT III: COMMUNITY STATISTICS
+# ==================================
+# Running totals for /api/users/stats, kept in one document:
+#   db.stats {_id: 'community', total_paintings, total_arrangements, ...}
+#
+# Routes that create, delete or like something $inc the matching counter,
+# so reading the stats is a single find_one.
+# The server calls snapshot() at startup, so the document exists with
+# every counter before the first $inc (which would otherwise upsert a
+# document holding just that one).
+#
+# rebuild() recounts everything with count_documents and a $group over
+# likes and overwrites the document. Run it periodically to correct drift
+# (flask --app server rebuild-stats, or STATS_RECONCILE_INTERVAL).
+
+
+STATS_ID = 'community'
+
+COUNTERS = [
+    'total_paintings',
+    'total_arrangements',
+    'total_bracelets',
+    'total_users',
+    'total_uploads',
+    'total_likes'
+]
+
+# Creation collection -> its counter
+CREATION_COUNTERS = {
+    'paintings': 'total_paintings',
+    'arrangements': 'total_arrangements',
+    'bracelets': 'total_bracelets'
+}
+
+
+class CommunityStats:
+
+    def __init__(self, db):
+        self.db = db
+
+    # ---------- updates ----------
+
+    def increment(self, **deltas):
+        # increment(total_paintings=1, total_likes=-3)
+        self.db.stats.update_one({'_id': STATS_ID}, {'$inc': deltas}, upsert=True)
+
+    def rebuild(self):
+        # Recount from the raw collections, replacing the running totals.
+        # An $inc landing while this runs can be lost; the next rebuild corrects it.
+        totals = {counter: self.db[collection].count_documents({})
+                  for collection, counter in CREATION_COUNTERS.items()}
+        totals['total_users'] = self.db.users.count_documents({})
+        totals['total_uploads'] = self.db.flowers.count_documents({}) + self.db.charms.count_documents({})
+
+        # Sum likes inside MongoDB instead of pulling every document across
+        likes = {'$group': {'_id': None, 'likes': {'$sum': '$likes'}}}
+        pipeline = [
+            likes,
+            {'$unionWith': {'coll': 'arrangements', 'pipeline': [likes]}},
+            {'$unionWith': {'coll': 'bracelets', 'pipeline': [likes]}},
+            {'$group': {'_id': None, 'likes': {'$sum': '$likes'}}}
+        ]
+        result = next(self.db.paintings.aggregate(pipeline), None)
+        totals['total_likes'] = result['likes'] if result else 0
+
+        self.db.stats.replace_one({'_id': STATS_ID}, totals, upsert=True)
+        return totals
+
+    # ---------- reads ----------
+
+    def snapshot(self):
+        # Same shape /api/users/stats has always returned
+        # A document missing counters was started by an $inc before any
+        # rebuild, so the others would read as 0
+        doc = self.db.stats.find_one({'_id': STATS_ID})
+        if doc is None or any(counter not in doc for counter in COUNTERS):
+            return self.rebuild()
+        return {counter: doc.get(counter, 0) for counter in COUNTERS}
+
@@ -0,0 +1,99 @@
+# PROJECT III: TRENDING RANKING
+# ==============================
+# /api/users/trending serves a precomputed top-K list across all workshops.
+#
+# refresh() scores every painting, arrangement and bracelet inside MongoDB
+# with a time-decayed formula:
+#   score = (likes + view_weight * views) / (age in hours + 2) ^ gravity
+# merges the three collections, keeps the best `size`, and stores them in
+# one document: db.trending {_id: 'global', items: [...], computed_at}.
+#
+# It runs on a schedule in the background, so requests only ever read the
+# stored list (from memory when this process computed it recently).
+
+
+import threading
+import time
+from datetime import datetime
+
+
+TRENDING_ID = 'global'
+
+CREATION_COLLECTIONS = ['paintings', 'arrangements', 'bracelets']
+
+# Everything a trending card shows (images load from image_url)
+ITEM_FIELDS = ['title', 'workshop_type', 'product_type', 'username', 'creator_id',
+               'likes', 'views', 'created_at']
+
+
+class TrendingRanker:
+
+    def __init__(self, db, size=100, gravity=1.5, view_weight=0.1, max_age=300):
+        self.db = db
+        self.size = size
+        self.gravity = gravity
+        self.view_weight = view_weight
+        self.max_age = max_age     # seconds before the in-memory list is re-read
+        self._lock = threading.Lock()
+        self._items = None
+        self._loaded_at = 0
+
+    def pipeline(self, now):
+        # Score one collection, keeping its best `size` (the most any merge can use)
+        age_hours = {'$divide': [{'$subtract': [now, '$created_at']}, 3600 * 1000]}
+        score = {'$divide': [
+            {'$add': [
+                {'$ifNull': ['$likes', 0]},
+                {'$multiply': [self.view_weight, {'$ifNull': ['$views', 0]}]}
+            ]},
+            {'$pow': [{'$add': [{'$max': [age_hours, 0]}, 2]}, self.gravity]}
+        ]}
+
+        project = {field: 1 for field in ITEM_FIELDS}
+        project['score'] = score
+        return [
+            {'$match': {'created_at': {'$type': 'date'}}},
+            {'$project': project},
+            {'$sort': {'score': -1}},
+            {'$limit': self.size}
+        ]
+
+    def refresh(self):
+        # Recompute the global ranking and store it
+        now = datetime.utcnow()
+        per_collection = self.pipeline(now)
+
+        pipeline = per_collection + [
+            {'$unionWith': {'coll': name, 'pipeline': per_collection}}
+            for name in CREATION_COLLECTIONS[1:]
+        ] + [
+            {'$sort': {'score': -1}},
+            {'$limit': self.size}
+        ]
+        items = list(self.db[CREATION_COLLECTIONS[0]].aggregate(pipeline))
+
+        self.db.trending.replace_one(
+            {'_id': TRENDING_ID},
+            {'items': items, 'computed_at': now},
+            upsert=True
+        )
+        with self._lock:
+            self._items = items
+            self._loaded_at = time.monotonic()
+        return items
+
+    def top(self, limit):
+        # Best `limit` creations from the stored ranking (callers must not modify them)
+        with self._lock:
+            if self._items is not None and time.monotonic() - self._loaded_at < self.max_age:
+                return self._items[:limit]
+
+        # Another worker may have refreshed more recently than this process
+        doc = self.db.trending.find_one({'_id': TRENDING_ID})
+        if doc is None:
+            return self.refresh()[:limit]
+
+        with self._lock:
+            self._items = doc['items']
+            self._loaded_at = time.monotonic()
+        return doc['items'][:limit]
@@ -0,0 +1,153 @@
+# PROJECT III: WRITE-BEHIND COUNTERS
+# ===================================
+# Likes and views don't need a database round trip per click.
+#
+# CounterBuffer collects increments in memory, coalesced per
+# (collection, document, field), so a hundred likes on one popular
+# painting become a single {$inc: {likes: 100}}. A background thread
+# flushes everything pending as one unordered bulk_write per collection:
+#  every flush_interval seconds
+#  sooner, once max_pending increments are waiting
+#  on shutdown (close(), registered with atexit)
+#
+# A flush that fails keeps its increments for the next attempt.
+#
+# Increments for documents that don't exist (bad ids, or deleted while the
+# increment was buffered) match nothing; they are left out of the totals
+# passed to on_flush, so derived counters like total_likes don't drift.
+
+
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import UpdateOne
+
+
+class CounterBuffer:
+
+    def __init__(self, db, flush_interval=0.2, max_pending=500, on_flush=None, logger=None):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_flush = on_flush    # called with {field: total applied} after each successful flush
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = defaultdict(int)     # (collection, _id, field) -> delta
+        self._pending_ops = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+        # Counters exposed through /api/queue-stats
+        self.flushes = 0
+        self.flushed_ops = 0
+        self.failed_flushes = 0
+        self.unmatched_keys = 0
+        self.last_flush_ms = 0
+
+        self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+        self._thread.start()
+
+    def add(self, collection, doc_id, field, delta=1):
+        with self._lock:
+            self._pending[(collection, doc_id, field)] += delta
+            self._pending_ops += 1
+            if self._pending_ops >= self.max_pending:
+                self._wake.set()
+
+    def flush(self):
+        # Write everything pending. Returns the number of increments written.
+        with self._flush_lock:
+            with self._lock:
+                pending, ops = self._pending, self._pending_ops
+                self._pending, self._pending_ops = defaultdict(int), 0
+            if not pending:
+                return 0
+
+            started = time.perf_counter()
+            by_collection = defaultdict(list)
+            ids_by_collection = defaultdict(set)
+            for (collection, doc_id, field), delta in pending.items():
+                by_collection[collection].append(UpdateOne({'_id': doc_id}, {'$inc': {field: delta}}))
+                ids_by_collection[collection].add(doc_id)
+
+            written = set()
+            missing = set()     # (collection, _id) whose update matched nothing
+            try:
+                for collection, requests in by_collection.items():
+                    result = self.db[collection].bulk_write(requests, ordered=False)
+                    written.add(collection)
+                    if result.matched_count < len(requests):
+                        missing.update((collection, doc_id)
+                                       for doc_id in self._missing_ids(collection, ids_by_collection[collection]))
+            except Exception:
+                # Put back what didn't reach the database
+                # (each coalesced key counts as one pending op from here on)
+                with self._lock:
+                    for key, delta in pending.items():
+                        if key[0] not in written:
+                            self._pending[key] += delta
+                            self._pending_ops += 1
+                self.failed_flushes += 1
+                # What did reach it still counts
+                totals = self._applied_totals(pending, written, missing)
+                if self.on_flush and totals:
+                    self.on_flush(totals)
+                raise
+
+            totals = self._applied_totals(pending, written, missing)
+            self.flushes += 1
+            self.flushed_ops += ops
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        if self.on_flush:
+            self.on_flush(totals)
+        return ops
+
+    def close(self):
+        # Stop the flusher and write whatever is left
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_ops": self._pending_ops,
+                "pending_keys": len(self._pending),
+                "flushes": self.flushes,
+                "flushed_ops": self.flushed_ops,
+                "failed_flushes": self.failed_flushes,
+                "unmatched_keys": self.unmatched_keys,
+                "last_flush_ms": self.last_flush_ms
+            }
+
+    def _applied_totals(self, pending, written, missing):
+        # {field: total} of the increments that were written and matched a document
+        totals = defaultdict(int)
+        for (collection, doc_id, field), delta in pending.items():
+            if collection not in written:
+                continue
+            if (collection, doc_id) in missing:
+                self.unmatched_keys += 1
+            else:
+                totals[field] += delta
+        return dict(totals)
+
+    def _missing_ids(self, collection, ids):
+        # Which of a bulk write's documents don't exist (only asked when
+        # matched_count says some update missed)
+        found = {doc['_id'] for doc in self.db[collection].find({'_id': {'$in': list(ids)}}, {'_id': 1})}
+        return ids - found
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error flushing counters: {str(e)}")